@@ -0,0 +1,145 @@
+import argparse
+import os
+import random
+import re
+import time
+
+# 基准测试不访问API，但导入 Config 需要有密钥
+os.environ.setdefault("GLM_API_KEY", "benchmark")
+
+from glm_client import GLMClient  # noqa: E402
+from text_processor import TextProcessor  # noqa: E402
+
+
+def legacy_needs_api_processing(text: str) -> bool:
+    """预编译之前的 GLMClient._needs_api_processing，作为对照"""
+    text = text.strip()
+    if len(text) < 8:
+        return False
+    skip_patterns = [
+        r"^(发言人\d+|=+|-+|\d{2}:\d{2})",
+        r"^chat-\d+",
+        r"^\d{4}年",
+        r"^文件|^转录|^记录",
+    ]
+    for pattern in skip_patterns:
+        if re.match(pattern, text):
+            return False
+    error_patterns = [
+        r"[\u4e00-\u9fa5]+的[\u4e00-\u9fa5]+",
+        r"在[\u4e00-\u9fa5]{1,4}",
+        r"因[该当]",
+        r"[那哪]里",
+        r"[申孙][玉一][飞斐]",
+        r"[庞][加][莱来]",
+    ]
+    for pattern in error_patterns:
+        if re.search(pattern, text):
+            return True
+    if len(text) > 15:
+        common_words = ["我觉", "应该", "可以", "因为", "所以", "然后", "但是"]
+        return any(word in text for word in common_words)
+    return False
+
+
+def legacy_is_header_line(line: str) -> bool:
+    """预编译之前的 TextProcessor._is_header_line，作为对照"""
+    header_patterns = [
+        r"^chat-\d+",
+        r"^\d{4}年",
+        r"^=+$",
+        r"^-+$",
+        r"^文件|^转录|^记录",
+        r"^$",
+    ]
+    for pattern in header_patterns:
+        if re.match(pattern, line):
+            return True
+    return False
+
+
+def generate_corpus(num_lines: int, seed: int = 0) -> list:
+    """生成模拟转录文本：发言人行、标题行和长短不一的内容行"""
+    rng = random.Random(seed)
+    words = [
+        "我觉的",
+        "今天",
+        "天气",
+        "很好",
+        "我们",
+        "在看看",
+        "那里",
+        "应该",
+        "因该",
+        "然后",
+        "但是",
+        "申玉飞",
+        "庞加莱",
+        "的",
+        "工作",
+        "计划",
+        "，",
+        "。",
+    ]
+    headers = ["chat-12", "2024年3月1日", "=====", "-----", "文件名称", "转录完成", ""]
+    lines = []
+    for i in range(num_lines):
+        roll = rng.random()
+        if roll < 0.05:
+            lines.append(rng.choice(headers))
+        elif roll < 0.3:
+            lines.append(f"发言人{rng.randint(1, 3)} {i // 60 % 60:02d}:{i % 60:02d}")
+        else:
+            lines.append("".join(rng.choices(words, k=rng.randint(1, 30))))
+    return lines
+
+
+def time_it(func, lines: list) -> tuple:
+    start = time.perf_counter()
+    results = [func(line) for line in lines]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark of the segment pre-filter and header classifiers"
+    )
+    parser.add_argument("--lines", type=int, default=100000, help="Corpus size")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed")
+    args = parser.parse_args()
+
+    lines = generate_corpus(args.lines, args.seed)
+    client = GLMClient()
+    processor = TextProcessor()
+
+    benchmarks = [
+        (
+            "_needs_api_processing",
+            legacy_needs_api_processing,
+            client._needs_api_processing,
+        ),
+        ("_is_header_line", legacy_is_header_line, processor._is_header_line),
+    ]
+
+    print(f"📊 Classifier benchmark on {len(lines)} lines")
+    print("=" * 60)
+    for name, legacy, current in benchmarks:
+        legacy_time, legacy_results = time_it(legacy, lines)
+        current_time, current_results = time_it(current, lines)
+        mismatches = sum(a != b for a, b in zip(legacy_results, current_results))
+        print(
+            f"{name}: legacy {legacy_time:.3f}s, compiled {current_time:.3f}s, "
+            f"speedup {legacy_time / current_time:.1f}x, mismatches {mismatches}"
+        )
+
+    rules = {}
+    for line in lines:
+        rule = client.classify_segment(line)[1]
+        rules[rule] = rules.get(rule, 0) + 1
+    print("\nRouting rules:")
+    for rule, count in sorted(rules.items(), key=lambda x: -x[1]):
+        print(f"  {rule}: {count}")
+
+
+if __name__ == "__main__":
+    main()
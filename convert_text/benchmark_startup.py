@@ -0,0 +1,96 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_PATH = os.path.join(SCRIPT_DIR, "main.py")
+
+
+def run_env() -> dict:
+    """子进程环境：不访问API，不写修正缓存"""
+    env = dict(os.environ)
+    env.setdefault("GLM_API_KEY", "benchmark")
+    env["CORRECTION_CACHE_PATH"] = ""
+    env["PYTHONPATH"] = SCRIPT_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def time_command(command: list, cwd: str, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            command,
+            cwd=cwd,
+            env=run_env(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def import_times(cwd: str, top: int) -> list:
+    """python -X importtime 的累计耗时，返回最慢的 top 个模块 [(微秒, 模块名)]"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=cwd,
+        env=run_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        entries.append((int(cumulative), module.rstrip()))
+    return sorted(entries, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import-time and CLI startup benchmark for convert_text/main.py"
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to show")
+    args = parser.parse_args()
+
+    # 在临时目录中运行，--dry-run 创建的输出目录不会落在仓库里
+    with tempfile.TemporaryDirectory() as workdir:
+        transcript = os.path.join(workdir, "sample.txt")
+        with open(transcript, "w", encoding="utf-8") as file:
+            file.write("发言人1 00:01\n我觉的今天的会议很有必要。\n")
+
+        commands = [
+            ("python -c pass", [sys.executable, "-c", "pass"]),
+            ("import main", [sys.executable, "-c", "import main"]),
+            ("main.py --help", [sys.executable, MAIN_PATH, "--help"]),
+            (
+                "main.py --dry-run",
+                [sys.executable, MAIN_PATH, transcript, "--dry-run"],
+            ),
+        ]
+
+        print(f"📊 Startup benchmark ({args.runs} runs each)")
+        print("=" * 60)
+        for name, command in commands:
+            timings = time_command(command, workdir, args.runs)
+            print(
+                f"{name:<20} median {statistics.median(timings) * 1000:7.1f}ms, "
+                f"min {min(timings) * 1000:7.1f}ms"
+            )
+
+        print("\nSlowest imports (cumulative, -X importtime):")
+        for cumulative, module in import_times(workdir, args.top):
+            print(f"  {cumulative / 1000:7.1f}ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
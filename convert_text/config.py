@@ -23,6 +23,22 @@ class Config:
     OUTPUT_DIR = "./output"
     LOG_DIR = "./logs"
 
-    MAX_RETRIES = 3
+    MAX_RETRIES = 3  # API请求失败后的最大重试次数
     REQUEST_TIMEOUT = 30
     RATE_LIMIT_DELAY = 0.1
+    MAX_CONCURRENT_BATCHES = 4
+    MAX_INPUT_TOKENS_PER_REQUEST = 3000  # 批量请求中待修正文本的输入token预算
+    HTTP_POOL_SIZE = 16  # 共享会话的连接池大小
+    RETRY_BACKOFF_BASE = 1.0  # 重试退避的初始等待秒数
+    RETRY_BACKOFF_MAX = 30.0  # 单次重试的最长等待秒数
+    RETRY_AFTER_MAX = 300.0  # 服务端 Retry-After 的上限，超过时记录日志
+    STREAM_CHUNK_SEGMENTS = 2000  # 流式处理时每次送入批量修正的分段数
+
+    # 分段修正缓存（SQLite），设置 CORRECTION_CACHE_PATH= 为空可关闭
+    CORRECTION_CACHE_PATH = os.getenv(
+        "CORRECTION_CACHE_PATH", "./cache/corrections.sqlite3"
+    )
+    CORRECTION_CACHE_MAX_ENTRIES = 200000
+
+    # 外部快速修正词典（每行：错误词<Tab>正确词），为空时只使用内置规则
+    QUICK_FIX_DICT = os.getenv("QUICK_FIX_DICT")
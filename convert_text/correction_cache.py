@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+def normalize_segment(text: str) -> str:
+    """缓存键使用的规范化文本：去掉首尾空白并合并连续空白"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class CorrectionCache:
+    """
+    跨文件、跨运行的分段修正缓存（SQLite）
+
+    以 (规范化文本, 模型, 提示词版本) 为键保存API修正结果。
+    超过 max_entries 时按最近使用时间淘汰最旧的条目。
+    同一进程内的线程共享一个连接并加锁；多个进程通过 SQLite 的文件锁
+    和 WAL 日志安全地并发写入。
+    """
+
+    def __init__(self, path: str, model: str, prompt_version: str, max_entries: int):
+        self.path = path
+        self.model = model
+        self.prompt_version = prompt_version
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # 连接在第一次使用时才打开：--dry-run 等不查缓存的路径不会创建数据库文件，
+        # fork 出的工作进程也不会沿用父进程的连接
+        self.connection = None
+        self.pid = None
+        # 条目数的上界估计，超过 max_entries 时才真正 COUNT(*) 并淘汰
+        self.size = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """返回当前进程的连接（调用方需持有 self.lock）"""
+        if self.connection is not None and self.pid == os.getpid():
+            return self.connection
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS corrections (
+                    text TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (text, model, prompt_version)
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS corrections_last_used "
+                "ON corrections (last_used)"
+            )
+            (self.size,) = connection.execute(
+                "SELECT COUNT(*) FROM corrections"
+            ).fetchone()
+        self.connection = connection
+        self.pid = os.getpid()
+        return connection
+
+    def get_many(self, texts: List[str]) -> Dict[str, Dict]:
+        """返回命中的 {规范化文本: 修正结果}，并更新命中/未命中计数"""
+        keys = list(dict.fromkeys(normalize_segment(text) for text in texts))
+        found = {}
+        now = time.time()
+        with self.lock:
+            connection = self._connect()
+            with connection:
+                # SQLite 默认最多 999 个绑定参数，分块查询
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i : i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = connection.execute(
+                        f"SELECT text, result FROM corrections WHERE model = ? "
+                        f"AND prompt_version = ? AND text IN ({placeholders})",
+                        [self.model, self.prompt_version, *chunk],
+                    ).fetchall()
+                    found.update((text, json.loads(result)) for text, result in rows)
+                connection.executemany(
+                    "UPDATE corrections SET last_used = ? WHERE text = ? "
+                    "AND model = ? AND prompt_version = ?",
+                    [(now, text, self.model, self.prompt_version) for text in found],
+                )
+                self.hits += len(found)
+                self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, results: Dict[str, Dict]):
+        """保存 {原文: 修正结果}，必要时淘汰最久未使用的条目"""
+        if not results:
+            return
+        now = time.time()
+        rows = [
+            (
+                normalize_segment(text),
+                self.model,
+                self.prompt_version,
+                json.dumps(result, ensure_ascii=False),
+                now,
+            )
+            for text, result in results.items()
+        ]
+        with self.lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO corrections "
+                    "(text, model, prompt_version, result, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                # 替换已有条目时 size 会偏大，只会让淘汰检查提前发生
+                self.size += len(rows)
+                if self.size > self.max_entries:
+                    self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection):
+        """
+        淘汰到 max_entries 的 90%，留出余量，
+        之后再插入约 10% 的条目才需要下一次 COUNT(*)
+        """
+        (count,) = connection.execute("SELECT COUNT(*) FROM corrections").fetchone()
+        target = self.max_entries * 9 // 10
+        if count > self.max_entries:
+            connection.execute(
+                "DELETE FROM corrections WHERE rowid IN ("
+                "SELECT rowid FROM corrections ORDER BY last_used LIMIT ?)",
+                (count - target,),
+            )
+            count = target
+        self.size = count
+
+    def stats(self) -> Dict:
+        with self.lock:
+            (size,) = (
+                self._connect().execute("SELECT COUNT(*) FROM corrections").fetchone()
+            )
+            return {"hits": self.hits, "misses": self.misses, "entries": size}
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+            self.connection = None
+
+
+def open_correction_cache(
+    path: Optional[str], model: str, prompt_version: str, max_entries: int
+) -> Optional[CorrectionCache]:
+    """path 为空时不使用缓存"""
+    if not path:
+        return None
+    return CorrectionCache(path, model, prompt_version, max_entries)
@@ -1,7 +1,10 @@
+import itertools
 import os
+import shutil
+import tempfile
 import time
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List
 
 from config import Config
 from glm_client import GLMClient
@@ -17,170 +20,245 @@ class ErrorDetector:
         os.makedirs(Config.OUTPUT_DIR, exist_ok=True)
         os.makedirs(Config.LOG_DIR, exist_ok=True)
 
-    def detect_and_correct_file(self, input_file: str) -> tuple:
-        print(f"Starting to process file: {input_file}")
-
+    def parse_valid_segments(self, input_file: str) -> List[Dict]:
         segments = self.text_processor.parse_transcription_file(input_file)
         print(f"Parsed {len(segments)} segments")
 
         valid_segments = [seg for seg in segments if seg.get("text", "").strip()]
         print(f"Valid segments: {len(valid_segments)}")
+        return valid_segments
+
+    def write_results(
+        self, results: List[Dict], input_file: str, only_correct: bool = False
+    ) -> tuple:
+        """写出已修正的结果，返回 (报告路径, 修正文件路径)；only_correct 时报告路径为 None"""
+        return self._write_outputs([results], input_file, only_correct)
+
+    def detect_and_correct_file(self, input_file: str) -> tuple:
+        print(f"Starting to process file: {input_file}")
 
         print("Starting error detection and auto-correction...")
         print("Using batch mode to greatly reduce API calls and token usage...")
 
+        return self._stream_file(input_file)
+
+    def _corrected_chunks(self, input_file: str) -> Iterator[List[Dict]]:
+        """
+        流式解析文件，每攒够 STREAM_CHUNK_SEGMENTS 个有效分段就交给批量修正，
+        逐块产出修正结果，内存占用与文件大小无关
+        """
+        segments = self.text_processor.iter_transcription_file(input_file)
+        valid_segments = (seg for seg in segments if seg.get("text", "").strip())
+        done = 0
+        while True:
+            chunk = list(itertools.islice(valid_segments, Config.STREAM_CHUNK_SEGMENTS))
+            if not chunk:
+                break
+            yield self.glm_client.batch_detect_and_correct_segments(chunk)
+            done += len(chunk)
+            if len(chunk) == Config.STREAM_CHUNK_SEGMENTS:
+                print(f"Valid segments processed so far: {done}")
+
+    def _stream_file(self, input_file: str, only_correct: bool = False) -> tuple:
         start_time = time.time()
-        results = self.glm_client.batch_detect_and_correct_segments(valid_segments)
+        paths = self._write_outputs(
+            self._corrected_chunks(input_file), input_file, only_correct
+        )
         end_time = time.time()
 
         processing_time = end_time - start_time
         print(f"Batch processing completed in {processing_time:.1f}s")
+        return paths
+
+    def _write_outputs(
+        self, result_chunks: Iterable[List[Dict]], input_file: str, only_correct: bool
+    ) -> tuple:
+        """
+        边接收修正结果边写修正文件；报告的明细先写入临时文件，
+        统计完成后再写在报告头部之后，因此不需要在内存中保留全部结果
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = os.path.splitext(os.path.basename(input_file))[0]
+        corrected_path = os.path.join(
+            Config.OUTPUT_DIR, f"{filename}_corrected_{timestamp}.txt"
+        )
+        report_path = None
+        details = None
+        if not only_correct:
+            report_path = os.path.join(
+                Config.OUTPUT_DIR, f"{filename}_correction_report_{timestamp}.txt"
+            )
+            details = tempfile.TemporaryFile(
+                "w+", encoding="utf-8", dir=Config.OUTPUT_DIR
+            )
 
-        report_path = self._generate_correction_report(results, input_file)
-
-        corrected_path = self._generate_corrected_file(results, input_file)
-
-        self._print_correction_summary(results)
+        counts = {
+            "total": 0,
+            "corrected": 0,
+            "errors": 0,
+            "batch_api": 0,
+            "quick_fix": 0,
+            "pre_filter": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+        }
+        try:
+            with open(corrected_path, "w", encoding="utf-8") as f:
+                f.write(f"{filename} - Auto-corrected Version (Batch-Optimized)\n\n")
+                f.write(
+                    f"Corrected at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                )
+                f.write(f"Original file: {input_file}\n")
+                f.write("=" * 50 + "\n\n")
+
+                for results in result_chunks:
+                    for result in results:
+                        self._count_result(counts, result)
+                        self._write_corrected_entry(f, result)
+                        if details:
+                            self._write_report_entry(details, counts["total"], result)
+
+            if details:
+                with open(report_path, "w", encoding="utf-8") as f:
+                    self._write_report_header(f, counts, input_file)
+                    details.seek(0)
+                    shutil.copyfileobj(details, f)
+        finally:
+            if details:
+                details.close()
+
+        self._print_correction_summary(counts)
 
         print("Processing complete!")
-        print(f"📊 Report: {report_path}")
+        if report_path:
+            print(f"📊 Report: {report_path}")
         print(f"📝 Corrected file: {corrected_path}")
 
         return report_path, corrected_path
 
-    def _generate_correction_report(self, results: List[Dict], input_file: str) -> str:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.splitext(os.path.basename(input_file))[0]
-        report_path = os.path.join(
-            Config.OUTPUT_DIR, f"{filename}_correction_report_{timestamp}.txt"
+    def _count_result(self, counts: Dict, result: Dict):
+        counts["total"] += 1
+        if result.get("has_errors", False):
+            counts["corrected"] += 1
+        if "error" in result:
+            counts["errors"] += 1
+        if result.get("method") in ("batch_api", "quick_fix", "pre_filter"):
+            counts[result["method"]] += 1
+        if result.get("cache") == "hit":
+            counts["cache_hits"] += 1
+        elif result.get("cache") == "miss":
+            counts["cache_misses"] += 1
+
+    def _write_report_header(self, f, counts: Dict, input_file: str):
+        total_segments = counts["total"]
+        corrected_segments = counts["corrected"]
+        api_errors = counts["errors"]
+
+        batch_api_count = counts["batch_api"]
+        quick_fix_count = counts["quick_fix"]
+        pre_filter_count = counts["pre_filter"]
+        cache_hits = counts["cache_hits"]
+        cache_misses = counts["cache_misses"]
+
+        f.write("=" * 70 + "\n")
+        f.write(
+            "Automatic Correction Report for Speech Transcription (Batch-Optimized)\n"
         )
-
-        total_segments = len(results)
-        corrected_segments = sum(1 for r in results if r.get("has_errors", False))
-        api_errors = sum(1 for r in results if "error" in r)
-
-        batch_api_count = len([r for r in results if r.get("method") == "batch_api"])
-        quick_fix_count = len([r for r in results if r.get("method") == "quick_fix"])
-        pre_filter_count = len([r for r in results if r.get("method") == "pre_filter"])
-
-        with open(report_path, "w", encoding="utf-8") as f:
-            f.write("=" * 70 + "\n")
-            f.write(
-                "Automatic Correction Report for Speech Transcription (Batch-Optimized)\n"
-            )
-            f.write("=" * 70 + "\n")
-            f.write(f"Input file: {input_file}\n")
-            f.write(f"Processed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Total segments: {total_segments}\n")
-            f.write(f"Corrected segments: {corrected_segments}\n")
-            f.write(
-                f"Correction rate: {corrected_segments / total_segments * 100:.2f}%\n"
-            )
-            if api_errors > 0:
-                f.write(f"API errors: {api_errors}\n")
-
-            f.write("\nProcessing method distribution:\n")
-            f.write(
-                f"  Batch API processing: {batch_api_count} ({batch_api_count / total_segments * 100:.1f}%)\n"
-            )
-            f.write(
-                f"  Quick fix: {quick_fix_count} ({quick_fix_count / total_segments * 100:.1f}%)\n"
-            )
+        f.write("=" * 70 + "\n")
+        f.write(f"Input file: {input_file}\n")
+        f.write(f"Processed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Total segments: {total_segments}\n")
+        f.write(f"Corrected segments: {corrected_segments}\n")
+        f.write(f"Correction rate: {corrected_segments / total_segments * 100:.2f}%\n")
+        if api_errors > 0:
+            f.write(f"API errors: {api_errors}\n")
+
+        f.write("\nProcessing method distribution:\n")
+        f.write(
+            f"  Batch API processing: {batch_api_count} ({batch_api_count / total_segments * 100:.1f}%)\n"
+        )
+        f.write(
+            f"  Quick fix: {quick_fix_count} ({quick_fix_count / total_segments * 100:.1f}%)\n"
+        )
+        f.write(
+            f"  Pre-filter skipped: {pre_filter_count} ({pre_filter_count / total_segments * 100:.1f}%)\n"
+        )
+        if cache_hits or cache_misses:
             f.write(
-                f"  Pre-filter skipped: {pre_filter_count} ({pre_filter_count / total_segments * 100:.1f}%)\n"
+                f"\nCorrection cache: {cache_hits} hits, {cache_misses} misses "
+                f"(hit rate {cache_hits / (cache_hits + cache_misses) * 100:.1f}%)\n"
             )
 
-            f.write("\n" + "=" * 70 + "\n")
-            f.write("Detailed corrections\n")
-            f.write("=" * 70 + "\n\n")
+        f.write("\n" + "=" * 70 + "\n")
+        f.write("Detailed corrections\n")
+        f.write("=" * 70 + "\n\n")
 
-            for i, result in enumerate(results, 1):
-                f.write(f"[Segment {i}]\n")
-                f.write(f"Time: {result.get('timestamp', 'Unknown')}\n")
-                f.write(f"Speaker: {result.get('speaker', 'Unknown')}\n")
-                f.write(f"Method: {result.get('method', 'Unknown')}\n")
+    def _write_report_entry(self, f, i: int, result: Dict):
+        f.write(f"[Segment {i}]\n")
+        f.write(f"Time: {result.get('timestamp', 'Unknown')}\n")
+        f.write(f"Speaker: {result.get('speaker', 'Unknown')}\n")
+        f.write(f"Method: {result.get('method', 'Unknown')}\n")
+        if result.get("cache") == "hit":
+            f.write("Cache: hit\n")
 
-                if "error" in result:
-                    f.write(f"❌ API call error: {result['error']}\n")
-                    f.write(f"Original: {result.get('text', '')}\n")
+        if "error" in result:
+            f.write(f"❌ API call error: {result['error']}\n")
+            f.write(f"Original: {result.get('text', '')}\n")
 
-                elif result.get("has_errors", False):
-                    f.write("🔧 Corrected\n")
+        elif result.get("has_errors", False):
+            f.write("🔧 Corrected\n")
+            f.write(
+                f"Original: {result.get('original_text', result.get('text', ''))}\n"
+            )
+            f.write(f"Fix: {result.get('corrected_text', '')}\n")
+            f.write(f"Confidence: {result.get('confidence', 0):.2f}\n")
+
+            errors = result.get("errors", [])
+            if errors:
+                f.write("Error details:\n")
+                for j, error in enumerate(errors, 1):
+                    f.write(f"  {j}. {error.get('type', 'Unknown')}: ")
                     f.write(
-                        f"Original: {result.get('original_text', result.get('text', ''))}\n"
-                    )
-                    f.write(f"Fix: {result.get('corrected_text', '')}\n")
-                    f.write(f"Confidence: {result.get('confidence', 0):.2f}\n")
-
-                    errors = result.get("errors", [])
-                    if errors:
-                        f.write("Error details:\n")
-                        for j, error in enumerate(errors, 1):
-                            f.write(f"  {j}. {error.get('type', 'Unknown')}: ")
-                            f.write(
-                                f"'{error.get('original', '')}' → '{error.get('corrected', '')}'\n"
-                            )
-                            if error.get("reason"):
-                                f.write(f"     Reason: {error.get('reason')}\n")
-
-                else:
-                    f.write("✅ No correction needed\n")
-                    f.write(f"Text: {result.get('text', '')}\n")
-
-                f.write("\n" + "-" * 50 + "\n\n")
-
-        return report_path
-
-    def _generate_corrected_file(self, results: List[Dict], input_file: str) -> str:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.splitext(os.path.basename(input_file))[0]
-        corrected_path = os.path.join(
-            Config.OUTPUT_DIR, f"{filename}_corrected_{timestamp}.txt"
-        )
-
-        with open(corrected_path, "w", encoding="utf-8") as f:
-            f.write(f"{filename} - Auto-corrected Version (Batch-Optimized)\n\n")
-            f.write(f"Corrected at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Original file: {input_file}\n")
-            f.write("=" * 50 + "\n\n")
-
-            for result in results:
-                speaker = result.get("speaker", "Unknown")
-                timestamp = result.get("timestamp", "Unknown")
-
-                if "error" in result:
-                    display_text = result.get("text", "[Processing error]")
-                    f.write(f"{speaker} {timestamp}\n")
-                    f.write(f"❌ {display_text}\n\n")
-
-                elif result.get("has_errors", False) and result.get("corrected_text"):
-                    corrected_text = result.get(
-                        "corrected_text", result.get("text", "")
+                        f"'{error.get('original', '')}' → '{error.get('corrected', '')}'\n"
                     )
-                    if "\n" in corrected_text:
-                        f.write(f"{speaker} {timestamp}\n")
-                        f.write(f"{corrected_text}\n\n")
-                    else:
-                        f.write(f"{speaker} {timestamp}\n")
-                        f.write(f"{corrected_text}\n\n")
-
-                else:
-                    original_text = result.get("text", "")
-                    if original_text.strip():
-                        f.write(f"{speaker} {timestamp}\n")
-                        f.write(f"{original_text}\n\n")
-
-        return corrected_path
-
-    def _print_correction_summary(self, results: List[Dict]):
-        total = len(results)
-        corrected = sum(1 for r in results if r.get("has_errors", False))
-        errors = sum(1 for r in results if "error" in r)
+                    if error.get("reason"):
+                        f.write(f"     Reason: {error.get('reason')}\n")
+
+        else:
+            f.write("✅ No correction needed\n")
+            f.write(f"Text: {result.get('text', '')}\n")
+
+        f.write("\n" + "-" * 50 + "\n\n")
+
+    def _write_corrected_entry(self, f, result: Dict):
+        speaker = result.get("speaker", "Unknown")
+        timestamp = result.get("timestamp", "Unknown")
+
+        if "error" in result:
+            display_text = result.get("text", "[Processing error]")
+            f.write(f"{speaker} {timestamp}\n")
+            f.write(f"❌ {display_text}\n\n")
+
+        elif result.get("has_errors", False) and result.get("corrected_text"):
+            corrected_text = result.get("corrected_text", result.get("text", ""))
+            f.write(f"{speaker} {timestamp}\n")
+            f.write(f"{corrected_text}\n\n")
+
+        else:
+            original_text = result.get("text", "")
+            if original_text.strip():
+                f.write(f"{speaker} {timestamp}\n")
+                f.write(f"{original_text}\n\n")
+
+    def _print_correction_summary(self, counts: Dict):
+        total = counts["total"]
+        corrected = counts["corrected"]
+        errors = counts["errors"]
         unchanged = total - corrected - errors
 
-        batch_api_count = len([r for r in results if r.get("method") == "batch_api"])
-        quick_fix_count = len([r for r in results if r.get("method") == "quick_fix"])
-        pre_filter_count = len([r for r in results if r.get("method") == "pre_filter"])
+        batch_api_count = counts["batch_api"]
+        quick_fix_count = counts["quick_fix"]
+        pre_filter_count = counts["pre_filter"]
 
         print("\n" + "=" * 50)
         print("📊 Correction Summary")
@@ -197,33 +275,17 @@ class ErrorDetector:
         print(
             f"Pre-filter skipped: {pre_filter_count} ({pre_filter_count / total * 100:.1f}%)"
         )
+        cache_hits = counts["cache_hits"]
+        cache_misses = counts["cache_misses"]
+        if cache_hits or cache_misses:
+            print(f"Correction cache: {cache_hits} hits, {cache_misses} misses")
         print("=" * 50)
 
     def detect_and_correct_file_only_correct(self, input_file: str) -> str:
         print(f"Starting to process file: {input_file}")
 
-        segments = self.text_processor.parse_transcription_file(input_file)
-        print(f"Parsed {len(segments)} segments")
-
-        valid_segments = [seg for seg in segments if seg.get("text", "").strip()]
-        print(f"Valid segments: {len(valid_segments)}")
-
         print(
             "Starting error detection and auto-correction (only generate corrected file)..."
         )
 
-        start_time = time.time()
-        results = self.glm_client.batch_detect_and_correct_segments(valid_segments)
-        end_time = time.time()
-
-        processing_time = end_time - start_time
-        print(f"Batch processing completed in {processing_time:.1f}s")
-
-        corrected_path = self._generate_corrected_file(results, input_file)
-
-        self._print_correction_summary(results)
-
-        print("Processing complete!")
-        print(f"📝 Corrected file: {corrected_path}")
-
-        return corrected_path
+        return self._stream_file(input_file, only_correct=True)[1]
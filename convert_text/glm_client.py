@@ -1,10 +1,105 @@
 import json
+import random
 import re
+import threading
 import time
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
 
 import requests
 from config import Config
+from correction_cache import normalize_segment, open_correction_cache
+from quick_fix import QuickFixMatcher, load_quick_fix_dict
+from requests.adapters import HTTPAdapter
+
+# 预过滤规则：各规则编译进一个正则，命中的分组名即规则名
+# 跳过明显的标题行、时间戳行或系统信息
+SKIP_PATTERN = re.compile(
+    r"^(?:"
+    r"(?P<speaker_or_time>发言人\d+|=+|-+|\d{2}:\d{2})"
+    r"|(?P<chat_id>chat-\d+)"
+    r"|(?P<date>\d{4}年)"
+    r"|(?P<file_info>文件|转录|记录)"
+    r")"
+)
+# 可能需要修正的模式（只判断是否出现，"X+的Y+"、"在X{1,4}" 等价于只看相邻的一个汉字，避免回溯）
+ERROR_PATTERN = re.compile(
+    r"(?P<de_particle>[\u4e00-\u9fa5]的[\u4e00-\u9fa5])"  # 可能的"的/得"问题
+    r"|(?P<zai_particle>在[\u4e00-\u9fa5])"  # 可能的"在/再"问题
+    r"|(?P<yinggai>因[该当])"  # 应该相关
+    r"|(?P<nali>[那哪]里)"  # 哪里/那里混用
+    r"|(?P<name_variant>[申孙][玉一][飞斐])"  # 人名变体
+    r"|(?P<poincare_variant>[庞][加][莱来])"  # 庞加莱变体
+)
+# 中长文本中的常见词汇
+COMMON_WORD_PATTERN = re.compile(r"我觉|应该|可以|因为|所以|然后|但是")
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶限速器：每 interval 秒补充一个令牌，最多积累 capacity 个
+    """
+
+    def __init__(self, interval: float, capacity: int = 1):
+        self.interval = interval
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.interval <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) / self.interval
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.interval
+            time.sleep(wait)
+
+
+# 批量修正提示词的版本，修改 _create_structured_batch_prompt 后需要递增，使旧缓存失效
+PROMPT_VERSION = "1"
+# 可以写入修正缓存的结果（API成功返回）；回复中缺失的编号（模型漏答、
+# 截断后拆分到上限仍缺失、重新请求失败）记为 batch_api_missing，不写入缓存，
+# 下次运行会重新请求
+CACHEABLE_METHODS = {"batch_api", "batch_api_no_change"}
+
+# 估算token数：汉字按1个token，其他字符按4个字符1个token
+CJK_PATTERN = re.compile(r"[\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]")
+# 批量提示词中每行"编号|"的额外开销，以及提示词模板本身的开销
+LINE_OVERHEAD_TOKENS = 4
+PROMPT_OVERHEAD_TOKENS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+# 值得重试的HTTP状态码：限流和服务端临时错误
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或HTTP日期），返回需要等待的秒数"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
 
 class GLMClient:
@@ -52,9 +147,48 @@ class GLMClient:
             "孙玉飞": "沈玉飞",
             "申一飞": "沈玉飞",
         }
-        self.batch_size = 25  # 每批处理的文本数量
+        if Config.QUICK_FIX_DICT:
+            self.quick_fixes.update(load_quick_fix_dict(Config.QUICK_FIX_DICT))
+        self.quick_fix_matcher = QuickFixMatcher(self.quick_fixes)
+        self.batch_size = 50  # 每批最多处理的文本数量，实际按token预算装箱
         self.max_tokens_per_request = 1200  # 每次请求的最大token数
-        self.api_retry_limit = 2  # API重试次数
+        self.max_input_tokens_per_request = Config.MAX_INPUT_TOKENS_PER_REQUEST
+        # 输出预算留出余量，避免估算偏小导致回复被截断
+        self.output_token_budget = int(self.max_tokens_per_request * 0.8)
+        self.max_split_depth = 3  # 截断后拆分重试的最大层数
+        self.max_retries = Config.MAX_RETRIES  # 失败后的最大重试次数
+        self.max_concurrent_batches = Config.MAX_CONCURRENT_BATCHES  # 并发批次数
+        # 所有线程共享的请求限速，平均每 RATE_LIMIT_DELAY 秒一个请求
+        self.rate_limiter = TokenBucket(
+            Config.RATE_LIMIT_DELAY, capacity=self.max_concurrent_batches
+        )
+
+        # 所有线程共享一个带连接池的会话，保持长连接，避免每次请求重新握手
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=Config.HTTP_POOL_SIZE, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}",
+            }
+        )
+        self.stats_lock = threading.Lock()
+        self.correction_cache = open_correction_cache(
+            Config.CORRECTION_CACHE_PATH,
+            self.model,
+            PROMPT_VERSION,
+            Config.CORRECTION_CACHE_MAX_ENTRIES,
+        )
+        self.http_stats = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "batches": 0,
+            "truncated": 0,
+            "rerequested_segments": 0,
+        }
 
     def test_connection(self) -> bool:
         print("Testing API connectivity...")
@@ -70,12 +204,49 @@ class GLMClient:
             print(f"❌ API connection exception: {e}")
             return False
 
+    def _retry_delay(self, attempt: int, response=None) -> float:
+        """优先使用 Retry-After，否则指数退避并加随机抖动"""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                if retry_after > Config.RETRY_AFTER_MAX:
+                    print(
+                        f"Server asked to retry after {retry_after:.0f}s, "
+                        f"waiting {Config.RETRY_AFTER_MAX:.0f}s instead"
+                    )
+                    return Config.RETRY_AFTER_MAX
+                return retry_after
+        delay = Config.RETRY_BACKOFF_BASE * 2**attempt
+        return min(delay, Config.RETRY_BACKOFF_MAX) * random.uniform(1.0, 1.5)
+
+    def _count(self, key: str, n: int = 1, call_stats: Optional[Dict] = None):
+        """累加客户端统计；call_stats 另外记录单次调用自己的计数"""
+        with self.stats_lock:
+            self.http_stats[key] += n
+            if call_stats is not None:
+                call_stats[key] = call_stats.get(key, 0) + n
+
+    def connection_stats(self) -> Dict:
+        """请求数、新建连接数和连接复用数"""
+        pools = self.session.get_adapter(self.base_url).poolmanager.pools
+        connections = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+        with self.stats_lock:
+            stats = dict(self.http_stats)
+        stats["connections"] = connections
+        stats["reused"] = max(0, stats["requests"] - connections)
+        return stats
+
     def _make_api_call(self, prompt: str, max_tokens: int = 300) -> Optional[str]:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-        }
+        return self._make_api_request(prompt, max_tokens)[0]
 
+    def _make_api_request(
+        self, prompt: str, max_tokens: int = 300
+    ) -> Tuple[Optional[str], bool]:
+        """返回 (回复内容, 是否因 max_tokens 被截断)"""
         payload = {
             "model": self.model,
             "messages": [{"role": "user", "content": prompt}],
@@ -85,36 +256,46 @@ class GLMClient:
             "stream": False,
         }
 
-        for attempt in range(self.api_retry_limit):
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            if attempt > 0:
+                self._count("retries")
+            self.rate_limiter.acquire()
             try:
-                response = requests.post(
+                self._count("requests")
+                response = self.session.post(
                     f"{self.base_url}chat/completions",
-                    headers=headers,
                     json=payload,
-                    timeout=30,
+                    timeout=Config.REQUEST_TIMEOUT,
                 )
 
                 if response.status_code == 200:
                     response_json = response.json()
                     content = self._extract_content_safely(response_json)
                     if content:
-                        return content
-                elif response.status_code == 429:
-                    time.sleep(2)  # 速率限制，等待后重试
-                    continue
+                        choices = response_json.get("choices") or [{}]
+                        return content, choices[0].get("finish_reason") == "length"
+                elif response.status_code in RETRY_STATUS_CODES:
+                    if response.status_code == 429:
+                        self._count("rate_limited")
+                    if not last_attempt:
+                        # 限流或服务端临时错误，等待后重试
+                        time.sleep(self._retry_delay(attempt, response))
+                        continue
+                    print(f"API error status code: {response.status_code}")
                 else:
                     print(f"API error status code: {response.status_code}")
                     break
 
             except Exception as e:
-                if attempt < self.api_retry_limit - 1:
-                    time.sleep(1)
+                if not last_attempt:
+                    time.sleep(self._retry_delay(attempt))
                     continue
                 else:
                     print(f"API call failed: {e}")
                     break
 
-        return None
+        return None, False
 
     def _extract_content_safely(self, response_json: dict) -> str:
         if "choices" not in response_json or not response_json["choices"]:
@@ -154,21 +335,24 @@ class GLMClient:
 
         return ""
 
-    def _apply_quick_fixes(self, text: str) -> tuple[str, list]:
-        corrected_text = text
-        errors = []
+    def load_quick_fixes(self, path: str):
+        """从外部词典追加快速修正规则，并重新编译匹配器"""
+        self.quick_fixes.update(load_quick_fix_dict(path))
+        self.quick_fix_matcher = QuickFixMatcher(self.quick_fixes)
+        print(f"Loaded quick-fix rules from {path}, {len(self.quick_fixes)} in total")
 
-        for wrong, correct in self.quick_fixes.items():
-            if wrong in corrected_text:
-                corrected_text = corrected_text.replace(wrong, correct)
-                errors.append(
-                    {
-                        "type": "快速修正",
-                        "original": wrong,
-                        "corrected": correct,
-                        "confidence": 0.95,
-                    }
-                )
+    def _apply_quick_fixes(self, text: str) -> tuple[str, list]:
+        # 所有规则单遍匹配，重叠时取最左最长的错误词
+        corrected_text, matched = self.quick_fix_matcher.apply(text)
+        errors = [
+            {
+                "type": "快速修正",
+                "original": wrong,
+                "corrected": self.quick_fixes[wrong],
+                "confidence": 0.95,
+            }
+            for wrong in matched
+        ]
 
         # 基本清理
         corrected_text = re.sub(r"\s+", " ", corrected_text).strip()
@@ -176,45 +360,32 @@ class GLMClient:
 
         return corrected_text, errors
 
-    def _needs_api_processing(self, text: str) -> bool:
+    def classify_segment(self, text: str) -> Tuple[bool, str]:
+        """
+        单遍预过滤，返回 (是否需要API处理, 命中的规则名)
+        """
         text = text.strip()
 
         # 跳过太短的文本
         if len(text) < 8:
-            return False
+            return False, "too_short"
 
-        # 跳过明显的标题行、时间戳行或系统信息
-        skip_patterns = [
-            r"^(发言人\d+|=+|-+|\d{2}:\d{2})",
-            r"^chat-\d+",
-            r"^\d{4}年",
-            r"^文件|^转录|^记录",
-        ]
-
-        for pattern in skip_patterns:
-            if re.match(pattern, text):
-                return False
-
-        # 检查是否包含可能需要修正的模式
-        error_patterns = [
-            r"[\u4e00-\u9fa5]+的[\u4e00-\u9fa5]+",  # 可能的"的/得"问题
-            r"在[\u4e00-\u9fa5]{1,4}",  # 可能的"在/再"问题
-            r"因[该当]",  # 应该相关
-            r"[那哪]里",  # 哪里/那里混用
-            r"[申孙][玉一][飞斐]",  # 人名变体
-            r"[庞][加][莱来]",  # 庞加莱变体
-        ]
+        match = SKIP_PATTERN.match(text)
+        if match:
+            return False, f"skip:{match.lastgroup}"
 
-        for pattern in error_patterns:
-            if re.search(pattern, text):
-                return True
+        match = ERROR_PATTERN.search(text)
+        if match:
+            return True, f"error:{match.lastgroup}"
 
         # 对于中长文本，如果包含常见词汇也考虑处理
-        if len(text) > 15:
-            common_words = ["我觉", "应该", "可以", "因为", "所以", "然后", "但是"]
-            return any(word in text for word in common_words)
+        if len(text) > 15 and COMMON_WORD_PATTERN.search(text):
+            return True, "common_word"
+
+        return False, "no_pattern"
 
-        return False
+    def _needs_api_processing(self, text: str) -> bool:
+        return self.classify_segment(text)[0]
 
     def detect_and_correct_text_errors(
         self, text_segment: str, context: str = ""
@@ -318,6 +489,7 @@ class GLMClient:
 
         quick_fix_count = 0
         pre_filter_count = 0
+        pre_filter_rules = {}
 
         for i, segment in enumerate(segments):
             text = segment.get("text", "").strip()
@@ -340,11 +512,13 @@ class GLMClient:
                 quick_fix_count += 1
                 continue
 
-            if not self._needs_api_processing(text):
+            needs_api, rule = self.classify_segment(text)
+            if not needs_api:
                 result = segment.copy()
                 result.update(self._create_result(text, text, False, [], "pre_filter"))
                 results.append(result)
                 pre_filter_count += 1
+                pre_filter_rules[rule] = pre_filter_rules.get(rule, 0) + 1
                 continue
 
             api_batch_texts.append(text)
@@ -354,10 +528,15 @@ class GLMClient:
         print(
             f"  Quick fixes: {quick_fix_count}, Pre-filter skipped: {pre_filter_count}"
         )
+        if pre_filter_rules:
+            print(
+                "  Pre-filter rules: "
+                + ", ".join(f"{k}={v}" for k, v in sorted(pre_filter_rules.items()))
+            )
 
         if api_batch_texts:
             print(f"  Needs API processing: {len(api_batch_texts)} segments")
-            api_results = self._batch_api_process(api_batch_texts)
+            api_results = self._cached_batch_api_process(api_batch_texts)
 
             for idx, (original_idx, api_result) in enumerate(
                 zip(api_batch_indices, api_results)
@@ -378,40 +557,185 @@ class GLMClient:
 
         return results
 
-    def _batch_api_process(self, texts: List[str]) -> List[Dict]:
+    def _rebind_result(self, text: str, result: Dict) -> Dict:
+        """把同一规范化文本的修正结果套用到 text 上"""
+        if result.get("has_errors"):
+            return self._create_result(
+                text, result["corrected_text"], True, result["errors"], result["method"]
+            )
+        return self._create_result(text, text, False, [], result["method"])
+
+    def _cached_batch_api_process(self, texts: List[str]) -> List[Dict]:
+        """
+        先查修正缓存，相同的文本只请求一次，成功的新结果写回缓存。
+        启用缓存时每个结果带有 cache 字段（hit/miss）
+        """
+        cache = self.correction_cache
+        cached = cache.get_many(texts) if cache else {}
+
+        pending = {}
+        hits = 0
+        for text in texts:
+            key = normalize_segment(text)
+            if key in cached:
+                hits += 1
+            elif key not in pending:
+                pending[key] = text
+        if cache:
+            print(f"  Correction cache: {hits} hits, {len(texts) - hits} misses")
+        if len(pending) < len(texts) - hits:
+            print(f"  Unique segments to request: {len(pending)}")
+
+        fresh = {}
+        if pending:
+            # 多个线程可能共用同一个客户端，本次调用的计数单独记录
+            call_stats = {"batches": 0, "truncated": 0, "rerequested_segments": 0}
+            api_results = self._batch_api_process(list(pending.values()), call_stats)
+            print(
+                f"  API batches: {call_stats['batches']}, "
+                f"truncated responses: {call_stats['truncated']}, "
+                f"re-requested segments: {call_stats['rerequested_segments']}"
+            )
+            fresh = dict(zip(pending, api_results))
+            if cache:
+                cache.put_many(
+                    {
+                        pending[key]: {
+                            "corrected_text": result["corrected_text"],
+                            "has_errors": result["has_errors"],
+                            "errors": result["errors"],
+                            "method": result["method"],
+                        }
+                        for key, result in fresh.items()
+                        if result["method"] in CACHEABLE_METHODS
+                    }
+                )
+
         results = []
+        for text in texts:
+            key = normalize_segment(text)
+            if key in cached:
+                result = self._rebind_result(text, cached[key])
+                result["cache"] = "hit"
+            else:
+                result = self._rebind_result(text, fresh[key])
+                if cache:
+                    result["cache"] = "miss"
+            results.append(result)
+        return results
 
-        for i in range(0, len(texts), self.batch_size):
-            batch = texts[i : i + self.batch_size]
-            print(
-                f"    Processing batch {i // self.batch_size + 1}, segments: {len(batch)}"
+    def _pack_batches(self, texts: List[str]) -> List[List[str]]:
+        """
+        按估算的输入/输出token装箱（保持原顺序），而不是固定条数：
+        短文本一批可以放更多条，长文本不会超出输出预算
+        """
+        batches = []
+        current = []
+        input_tokens = PROMPT_OVERHEAD_TOKENS
+        output_tokens = 0
+        for text in texts:
+            # 修正后的文本与原文长度相近，输入和输出按同样的token数估算
+            tokens = estimate_tokens(text) + LINE_OVERHEAD_TOKENS
+            if current and (
+                len(current) >= self.batch_size
+                or input_tokens + tokens > self.max_input_tokens_per_request
+                or output_tokens + tokens > self.output_token_budget
+            ):
+                batches.append(current)
+                current = []
+                input_tokens = PROMPT_OVERHEAD_TOKENS
+                output_tokens = 0
+            current.append(text)
+            input_tokens += tokens
+            output_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _batch_api_process(
+        self, texts: List[str], call_stats: Optional[Dict] = None
+    ) -> List[Dict]:
+        batches = self._pack_batches(texts)
+        if not batches:
+            return []
+
+        # 批次并发发送，请求速率由 rate_limiter 控制；map 按批次顺序返回结果
+        workers = max(1, min(self.max_concurrent_batches, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            batch_results = executor.map(
+                self._process_api_batch,
+                range(1, len(batches) + 1),
+                batches,
+                [call_stats] * len(batches),
             )
+            return [result for results in batch_results for result in results]
 
-            try:
-                batch_prompt = self._create_structured_batch_prompt(batch)
-                api_response = self._make_api_call(
-                    batch_prompt, max_tokens=self.max_tokens_per_request
-                )
+    def _process_api_batch(
+        self, batch_number: int, batch: List[str], call_stats: Optional[Dict] = None
+    ) -> List[Dict]:
+        print(f"    Processing batch {batch_number}, segments: {len(batch)}")
 
-                if api_response:
-                    batch_results = self._parse_structured_response(api_response, batch)
-                    results.extend(batch_results)
-                else:
-                    for text in batch:
-                        results.append(
-                            self._create_result(text, text, False, [], "api_failed")
-                        )
+        try:
+            corrected_map = self._request_corrections(batch, call_stats=call_stats)
+            if corrected_map is None:
+                return [
+                    self._create_result(text, text, False, [], "api_failed")
+                    for text in batch
+                ]
+            return self._build_batch_results(corrected_map, batch)
 
-            except Exception as e:
-                print(f"    Batch processing failed: {e}")
-                for text in batch:
-                    results.append(
-                        self._create_result(text, text, False, [], "api_error")
-                    )
+        except Exception as e:
+            print(f"    Batch processing failed: {e}")
+            return [
+                self._create_result(text, text, False, [], "api_error")
+                for text in batch
+            ]
+
+    def _request_corrections(
+        self, batch: List[str], depth: int = 0, call_stats: Optional[Dict] = None
+    ) -> Optional[Dict[int, str]]:
+        """
+        请求一批文本的修正结果（编号从1开始）。回复被截断时，
+        最后一行可能不完整，连同缺失的编号拆成两半重新请求
+        """
+        estimated_output = sum(
+            estimate_tokens(text) + LINE_OVERHEAD_TOKENS for text in batch
+        )
+        # 单条超长文本会独占一批，放宽它的输出上限
+        max_tokens = max(self.max_tokens_per_request, int(estimated_output * 1.25))
 
-            time.sleep(0.2)
+        self._count("batches", call_stats=call_stats)
+        api_response, truncated = self._make_api_request(
+            self._create_structured_batch_prompt(batch), max_tokens=max_tokens
+        )
+        if not api_response:
+            return None
 
-        return results
+        corrected_map = self._extract_corrections_from_response(api_response, batch)
+        if not truncated:
+            return corrected_map
+
+        self._count("truncated", call_stats=call_stats)
+        if corrected_map:
+            corrected_map.pop(max(corrected_map))
+        missing = [i for i in range(1, len(batch) + 1) if i not in corrected_map]
+        if not missing or depth >= self.max_split_depth:
+            return corrected_map
+
+        print(
+            f"    Response truncated, re-requesting {len(missing)} of {len(batch)} segments"
+        )
+        self._count("rerequested_segments", len(missing), call_stats)
+        halves = [missing]
+        if len(missing) > 1:
+            halves = [missing[: len(missing) // 2], missing[len(missing) // 2 :]]
+        for indices in halves:
+            sub_map = self._request_corrections(
+                [batch[i - 1] for i in indices], depth + 1, call_stats
+            )
+            for sub_index, corrected in (sub_map or {}).items():
+                corrected_map[indices[sub_index - 1]] = corrected
+        return corrected_map
 
     def _create_structured_batch_prompt(self, texts: List[str]) -> str:
         numbered_texts = []
@@ -430,14 +754,30 @@ class GLMClient:
     def _parse_structured_response(
         self, response: str, original_texts: List[str]
     ) -> List[Dict]:
-        results = []
-
         corrected_map = self._extract_corrections_from_response(
             response, original_texts
         )
+        return self._build_batch_results(corrected_map, original_texts)
+
+    def _build_batch_results(
+        self, corrected_map: Dict[int, str], original_texts: List[str]
+    ) -> List[Dict]:
+        results = []
+        missing = len(original_texts) - sum(
+            1 for i in range(1, len(original_texts) + 1) if i in corrected_map
+        )
+        if missing:
+            print(f"    {missing} segments missing from the reply, left unchanged")
 
         for i, original_text in enumerate(original_texts, 1):
-            corrected_text = corrected_map.get(i, original_text)
+            if i not in corrected_map:
+                results.append(
+                    self._create_result(
+                        original_text, original_text, False, [], "batch_api_missing"
+                    )
+                )
+                continue
+            corrected_text = corrected_map[i]
 
             # 验证修正文本的有效性
             if corrected_text and corrected_text != original_text:
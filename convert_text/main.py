@@ -110,7 +110,125 @@ def process_single_file(detector: ErrorDetector, file_path: str, args) -> dict:
         }
 
 
-def generate_batch_summary(results: list, output_dir: str) -> str:
+def process_files_batched(detector: ErrorDetector, files: list, args) -> list:
+    """
+    目录模式：先解析所有文件，把全部分段放进同一个队列统一去重、装箱并发请求，
+    避免每个小文件各自产生未装满的批次；修正结果再按文件切分写回
+    """
+    results = []
+    parsed = []
+    for file in files:
+        print(f"\n📄 Parsing file: {file}")
+        start_time = time.time()
+        try:
+            segments = detector.parse_valid_segments(file)
+        except Exception as e:
+            print(f"❌ {file} - failed: {str(e)}")
+            results.append(
+                {
+                    "file": file,
+                    "status": "error",
+                    "report_path": None,
+                    "corrected_path": None,
+                    "processing_time": 0,
+                    "error": str(e),
+                }
+            )
+            if not args.continue_on_error:
+                print(
+                    "⚠️ Aborting (use --continue-on-error to continue with other files)"
+                )
+                return results
+            continue
+        parsed.append((file, segments, time.time() - start_time))
+
+    all_segments = [segment for _, segments, _ in parsed for segment in segments]
+    print(
+        f"\n📦 Cross-file batching: {len(all_segments)} segments from {len(parsed)} files"
+    )
+    start_time = time.time()
+    corrections = detector.glm_client.batch_detect_and_correct_segments(all_segments)
+    batch_time = time.time() - start_time
+    print(f"Batch processing completed in {batch_time:.1f}s")
+
+    offset = 0
+    for file, segments, parse_time in parsed:
+        file_results = corrections[offset : offset + len(segments)]
+        offset += len(segments)
+        # 共享批次的耗时按分段数分摊到各文件
+        share = batch_time * len(segments) / max(len(all_segments), 1)
+        print(f"\n📄 Writing results: {file}")
+        start_time = time.time()
+        try:
+            report_path, corrected_path = detector.write_results(
+                file_results, file, args.only_correct
+            )
+        except Exception as e:
+            print(f"❌ {file} - failed: {str(e)}")
+            results.append(
+                {
+                    "file": file,
+                    "status": "error",
+                    "report_path": None,
+                    "corrected_path": None,
+                    "processing_time": 0,
+                    "error": str(e),
+                }
+            )
+            if not args.continue_on_error:
+                print(
+                    "⚠️ Aborting (use --continue-on-error to continue with other files)"
+                )
+                break
+            continue
+        results.append(
+            {
+                "file": file,
+                "status": "success",
+                "report_path": report_path,
+                "corrected_path": corrected_path,
+                "processing_time": parse_time + share + time.time() - start_time,
+                "error": None,
+            }
+        )
+
+    return results
+
+
+# 进程池模式下每个工作进程各自持有的检测器，由 init_worker 创建
+_worker_detector = None
+_worker_args = None
+
+
+def init_worker(api_key: str, args):
+    """进程池初始化：每个工作进程只创建一次检测器"""
+    global _worker_detector, _worker_args
+    _worker_detector = ErrorDetector(api_key)
+    configure_high_api_usage(_worker_detector, args.api_mode)
+    # 各进程的限速器相互独立，按进程数放大间隔，保持总请求速率不变
+    _worker_detector.glm_client.rate_limiter.interval *= args.processes
+    _worker_args = args
+
+
+def process_file_in_worker(file_path: str) -> dict:
+    result = process_single_file(_worker_detector, file_path, _worker_args)
+    result["worker"] = os.getpid()
+    result["connection_stats"] = _worker_detector.glm_client.connection_stats()
+    return result
+
+
+def sum_connection_stats(worker_stats: dict) -> dict:
+    """汇总各工作进程最新的累计连接统计"""
+    total = {}
+    for stats in worker_stats.values():
+        for key, value in stats.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def generate_batch_summary(
+    results: list, output_dir: str, connection_stats: dict = None
+) -> str:
     from datetime import datetime
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -133,6 +251,14 @@ def generate_batch_summary(results: list, output_dir: str) -> str:
         f.write(f"总耗时: {total_time:.1f}秒\n")
         f.write(f"平均耗时: {total_time / total_files:.1f}秒/文件\n\n")
 
+        if connection_stats:
+            f.write("API连接统计:\n")
+            f.write(f"  请求数: {connection_stats['requests']}\n")
+            f.write(f"  新建连接: {connection_stats['connections']}\n")
+            f.write(f"  复用连接: {connection_stats['reused']}\n")
+            f.write(f"  重试次数: {connection_stats['retries']}\n")
+            f.write(f"  限流响应(429): {connection_stats['rate_limited']}\n\n")
+
         f.write("=" * 70 + "\n")
         f.write("详细处理结果\n")
         f.write("=" * 70 + "\n\n")
@@ -193,6 +319,17 @@ def main():
         metavar="N",
         help="Number of parallel threads (default: serial processing)",
     )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        metavar="N",
+        help="Number of worker processes, each with its own detector (overrides --parallel)",
+    )
+    parser.add_argument(
+        "--global-batch",
+        action="store_true",
+        help="Pack API segments from all files into shared batches (overrides --parallel/--processes)",
+    )
     parser.add_argument(
         "--continue-on-error",
         action="store_true",
@@ -268,15 +405,41 @@ def main():
 
         results = []
 
-        if args.parallel and args.parallel > 1:
-            print(f"📄 Using {args.parallel} threads for parallel processing...")
-            from concurrent.futures import ThreadPoolExecutor, as_completed
+        worker_stats = {}
+        use_processes = args.processes and args.processes > 1
+        if args.global_batch and len(files) > 1:
+            results = process_files_batched(detector, files, args)
+        elif use_processes or (args.parallel and args.parallel > 1):
+            from concurrent.futures import (
+                ProcessPoolExecutor,
+                ThreadPoolExecutor,
+                as_completed,
+            )
 
-            with ThreadPoolExecutor(max_workers=args.parallel) as executor:
-                future_to_file = {
-                    executor.submit(process_single_file, detector, file, args): file
-                    for file in files
-                }
+            if use_processes:
+                print(f"📄 Using {args.processes} worker processes...")
+                executor = ProcessPoolExecutor(
+                    max_workers=args.processes,
+                    initializer=init_worker,
+                    initargs=(api_key, args),
+                )
+            else:
+                print(f"📄 Using {args.parallel} threads for parallel processing...")
+                executor = ThreadPoolExecutor(max_workers=args.parallel)
+
+            # 大文件先提交，空闲的工作者再领取小文件，负载更均衡
+            files_by_size = sorted(files, key=os.path.getsize, reverse=True)
+            with executor:
+                if use_processes:
+                    future_to_file = {
+                        executor.submit(process_file_in_worker, file): file
+                        for file in files_by_size
+                    }
+                else:
+                    future_to_file = {
+                        executor.submit(process_single_file, detector, file, args): file
+                        for file in files_by_size
+                    }
 
                 for i, future in enumerate(as_completed(future_to_file), 1):
                     file = future_to_file[future]
@@ -285,6 +448,10 @@ def main():
                     try:
                         result = future.result()
                         results.append(result)
+                        if "worker" in result:
+                            worker_stats[result["worker"]] = result.pop(
+                                "connection_stats"
+                            )
 
                         if result["status"] == "success":
                             print(f"✅ {result['file']} - succeeded")
@@ -294,6 +461,7 @@ def main():
                                 print(
                                     "⚠️ Aborting (use --continue-on-error to continue with other files)"
                                 )
+                                executor.shutdown(cancel_futures=True)
                                 break
 
                     except Exception as e:
@@ -329,8 +497,15 @@ def main():
                         )
                         break
 
+        if worker_stats:
+            connection_stats = sum_connection_stats(worker_stats)
+        else:
+            connection_stats = detector.glm_client.connection_stats()
+
         if len(files) > 1:
-            summary_path = generate_batch_summary(results, Config.OUTPUT_DIR)
+            summary_path = generate_batch_summary(
+                results, Config.OUTPUT_DIR, connection_stats
+            )
             print(f"\n📈 Batch summary: {summary_path}")
 
         successful = len([r for r in results if r["status"] == "success"])
@@ -351,6 +526,11 @@ def main():
         print(f"   Total time: {total_time:.1f}s")
         if successful > 0:
             print(f"   Avg time: {total_time / successful:.1f}s/file")
+        print(
+            f"   API requests: {connection_stats['requests']} over "
+            f"{connection_stats['connections']} connections "
+            f"({connection_stats['reused']} reused, {connection_stats['retries']} retries)"
+        )
 
         if successful > 0:
             print(f"\n📁 Output files saved to: {Config.OUTPUT_DIR}")
@@ -0,0 +1,141 @@
+import re
+from typing import Dict, List, Tuple
+
+
+class QuickFixMatcher:
+    """
+    多模式快速修正引擎（Aho-Corasick 自动机）
+
+    所有规则编译成一个自动机，对文本只扫描一遍，耗时与规则数量无关。
+    重叠的规则按“最左最长”选择：从左到右，每个位置取能匹配的最长错误词，
+    替换后从该词之后继续匹配，替换结果不会再被其他规则改写。
+
+    规则较少时（默认的几十条）改用一个按长度降序排列的多选正则，
+    匹配语义相同，但扫描在C中完成，比纯Python的自动机快；
+    规则较多时先用首字集合过滤，不含任何规则首字的分段不进入自动机。
+    """
+
+    # 超过该规则数时多选正则逐一尝试分支的开销超过自动机
+    REGEX_MAX_RULES = 300
+
+    def __init__(self, rules: Dict[str, str]):
+        self.rules = {wrong: correct for wrong, correct in rules.items() if wrong}
+        self._pattern = None
+        if len(self.rules) <= self.REGEX_MAX_RULES:
+            # 同一位置按先后尝试分支，长词在前即为“最左最长”
+            self._pattern = re.compile(
+                "|".join(
+                    re.escape(wrong)
+                    for wrong in sorted(self.rules, key=len, reverse=True)
+                )
+            )
+        else:
+            self._first_chars = frozenset(wrong[0] for wrong in self.rules)
+            self._build()
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def _build(self):
+        # 节点 0 为根；goto 为转移表，fail 为失配指针，
+        # out 为在该节点结束的所有规则长度（包括沿失配链可达的规则）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        for wrong in self.rules:
+            node = 0
+            for char in wrong:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = next_node
+            self._out[node] = (len(wrong),)
+
+        # 按层次遍历计算失配指针
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] += self._out[self._fail[child]]
+
+    def _longest_at(self, text: str) -> Dict[int, int]:
+        """每个匹配起点 -> 从该起点开始的最长规则长度"""
+        goto, fail, out = self._goto, self._fail, self._out
+        longest = {}
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length in out[node]:
+                start = end - length
+                if length > longest.get(start, 0):
+                    longest[start] = length
+        return longest
+
+    def apply(self, text: str) -> Tuple[str, List[str]]:
+        """
+        单遍应用所有规则，返回修正后的文本和命中的错误词（按首次出现顺序去重）
+        """
+        if not self.rules:
+            return text, []
+        if self._pattern is not None:
+            return self._apply_pattern(text)
+        if self._first_chars.isdisjoint(text):
+            return text, []
+        longest = self._longest_at(text)
+        if not longest:
+            return text, []
+
+        pieces = []
+        matched = {}
+        position = 0
+        for start in sorted(longest):
+            if start < position:
+                continue
+            wrong = text[start : start + longest[start]]
+            pieces.append(text[position:start])
+            pieces.append(self.rules[wrong])
+            matched.setdefault(wrong, None)
+            position = start + len(wrong)
+        pieces.append(text[position:])
+        return "".join(pieces), list(matched)
+
+    def _apply_pattern(self, text: str) -> Tuple[str, List[str]]:
+        matched = {}
+
+        def replace(match: re.Match) -> str:
+            matched.setdefault(match.group(), None)
+            return self.rules[match.group()]
+
+        corrected = self._pattern.sub(replace, text)
+        return corrected, list(matched)
+
+
+def load_quick_fix_dict(path: str) -> Dict[str, str]:
+    """
+    读取外部快速修正词典，每行一条规则：错误词<Tab>正确词
+    空行和以 # 开头的行会被忽略；后出现的同名规则覆盖先出现的规则
+    """
+    rules = {}
+    with open(path, "r", encoding="utf-8") as file:
+        for line_num, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split("\t") if "\t" in line else line.split()
+            if len(parts) != 2 or not parts[0].strip():
+                raise ValueError(
+                    f"Invalid quick-fix rule at {path}:{line_num}: {line!r}"
+                )
+            rules[parts[0].strip()] = parts[1].strip()
+    return rules
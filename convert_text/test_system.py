@@ -248,6 +248,44 @@ def test_batch_optimization():
         return False
 
 
+def test_cache_skips_missing_segments():
+    print("\n💾 Testing correction cache with a partial reply...")
+    texts = [
+        "然后我们应该去哪儿吃饭比较好呢各位朋友",
+        "因为明天要开会所以今天大家早点休息一下吧",
+        "但是这个问题需要大家一起想办法才能解决",
+    ]
+    replies = [f"1|{texts[0]}\n3|{texts[2]}"]
+    prompts = []
+
+    def fake_request(prompt, max_tokens=300):
+        prompts.append(prompt)
+        if replies:
+            return replies.pop(0), False
+        numbered = prompt.split("输入：\n")[1].split("\n\n输出")[0]
+        return numbered, False
+
+    cache_path = Config.CORRECTION_CACHE_PATH
+    with tempfile.TemporaryDirectory() as cache_dir:
+        Config.CORRECTION_CACHE_PATH = os.path.join(cache_dir, "cache.sqlite3")
+        try:
+            for _ in range(2):
+                client = GLMClient()
+                client._make_api_request = fake_request
+                results = client.batch_detect_and_correct_texts(texts)
+                client.correction_cache.close()
+        finally:
+            Config.CORRECTION_CACHE_PATH = cache_path
+
+    # 第一次回复漏掉了第2行，它不能作为“无需修正”写入缓存
+    assert len(prompts) == 2, prompts
+    assert texts[1] in prompts[1]
+    assert texts[0] not in prompts[1] and texts[2] not in prompts[1]
+    assert all(r["method"] == "batch_api_no_change" for r in results), results
+    print("✅ Segment missing from the reply was requested again")
+    return True
+
+
 def main():
     print("🚀 Starting system tests (batch-optimized)...\n")
 
@@ -258,6 +296,7 @@ def main():
         ("File format support", test_file_formats),
         ("Error detector (batch)", test_error_detector),
         ("Batch optimization", test_batch_optimization),
+        ("Correction cache (partial reply)", test_cache_skips_missing_segments),
     ]
 
     passed = 0
@@ -1,48 +1,83 @@
+import itertools
 import re
-from typing import Dict, List
-
-import jieba
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# 标题行或无关行，命中的分组名即规则名
+HEADER_PATTERN = re.compile(
+    r"^(?:"
+    r"(?P<chat_id>chat-\d+)"
+    r"|(?P<date>\d{4}年)"
+    r"|(?P<equals_rule>=+$)"
+    r"|(?P<dash_rule>-+$)"
+    r"|(?P<file_info>文件|转录|记录)"
+    r"|(?P<empty>$)"
+    r")"
+)
+# 识别文件格式时读取的开头行数
+FORMAT_DETECT_LINES = 20
+
+SPEAKER_TIMESTAMP_PATTERN = re.compile(r"^发言人(\d+)\s+(\d{2}:\d{2})")
+BRACKET_TIMESTAMP_PATTERN = re.compile(r"\[\d{2}:\d{2}:\d{2}")
+# 传统单行格式，按优先级排列
+RANGE_SPEAKER_LINE_PATTERN = re.compile(
+    r"\[(\d{2}:\d{2}:\d{2}-\d{2}:\d{2}:\d{2})\]\s*([^:]+):\s*(.+)"
+)
+TIMESTAMP_LINE_PATTERN = re.compile(r"\[(\d{2}:\d{2}:\d{2})\]\s*(.+)")
+SPEAKER_BRACKET_LINE_PATTERN = re.compile(r"([^[]+)\[(\d{2}:\d{2}:\d{2})\]:\s*(.+)")
+SPEAKER_COLON_LINE_PATTERN = re.compile(
+    r"^(发言人\d+|[\u4e00-\u9fa5]{2,8})[:：]\s*(.+)"
+)
 
 
 class TextProcessor:
-    def __init__(self):
-        jieba.initialize()
-
     def parse_transcription_file(self, file_path: str) -> List[Dict]:
         """
         解析转录文件，自动识别格式并提取时间戳、发言人和文本
         """
-        with open(file_path, "r", encoding="utf-8") as file:
-            content = file.read()
+        return list(self.iter_transcription_file(file_path))
 
-        file_format = self._detect_format(content)
-        print(f"🔍 Detected transcription file format: {file_format}")
+    def iter_transcription_file(
+        self, file_path: str, detect_lines: int = FORMAT_DETECT_LINES
+    ) -> Iterator[Dict]:
+        """
+        逐行流式解析转录文件，每次产出一个分段
 
-        if file_format == "speaker_timestamp":
-            return self._parse_speaker_timestamp_format(content)
-        elif file_format == "timestamp_speaker":
-            return self._parse_timestamp_speaker_format(content)
-        else:
-            return self._parse_mixed_format(content)
+        只读取前 detect_lines 行识别格式，之后边读边解析，
+        内存占用与文件大小无关。行号从第一个非空行开始计数
+        """
+        with open(file_path, "r", encoding="utf-8") as file:
+            lines = (line.rstrip("\n") for line in file)
+            # 跳过开头的空行，与按整个文件 strip() 后再分行的行号保持一致
+            lines = itertools.dropwhile(lambda line: not line.strip(), lines)
+            head = list(itertools.islice(lines, detect_lines))
+
+            file_format = self._detect_format(head)
+            print(f"🔍 Detected transcription file format: {file_format}")
+
+            lines = itertools.chain(head, lines)
+            if file_format == "speaker_timestamp":
+                yield from self._parse_speaker_timestamp_format(lines)
+            elif file_format == "timestamp_speaker":
+                yield from self._parse_timestamp_speaker_format(lines)
+            else:
+                yield from self._parse_mixed_format(lines)
 
-    def _detect_format(self, content: str) -> str:
+    def _detect_format(self, lines: Iterable[str]) -> str:
         """
-        自动检测转录文件的格式
+        根据开头的若干行自动检测转录文件的格式
         """
-        lines = content.strip().split("\n")
-
         speaker_timestamp_count = 0
         timestamp_speaker_count = 0
 
-        for line in lines[:20]:
+        for line in lines:
             line = line.strip()
             if not line:
                 continue
 
-            if re.match(r"^发言人\d+\s+\d{2}:\d{2}", line):
+            if SPEAKER_TIMESTAMP_PATTERN.match(line):
                 speaker_timestamp_count += 1
 
-            if re.match(r"\[\d{2}:\d{2}:\d{2}", line):
+            if BRACKET_TIMESTAMP_PATTERN.match(line):
                 timestamp_speaker_count += 1
 
         if speaker_timestamp_count > timestamp_speaker_count:
@@ -52,70 +87,45 @@ class TextProcessor:
         else:
             return "mixed"
 
-    def _parse_speaker_timestamp_format(self, content: str) -> List[Dict]:
+    def _parse_speaker_timestamp_format(self, lines: Iterable[str]) -> Iterator[Dict]:
         """
         解析 "发言人X 时间戳" 后跟内容的格式
-        """
-        lines = content.strip().split("\n")
-        segments = []
-        i = 0
 
-        while i < len(lines):
-            line = lines[i].strip()
+        单遍扫描：遇到新的发言人行时产出上一个分段，
+        发言人行之间的所有非空行（包括标题样式的行）都属于该分段
+        """
+        current = None
+        content_lines = []
 
-            if not line or self._is_header_line(line):
-                i += 1
+        for line_num, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
                 continue
 
-            pattern = r"^发言人(\d+)\s+(\d{2}:\d{2})"
-            match = re.match(pattern, line)
-
+            match = SPEAKER_TIMESTAMP_PATTERN.match(line)
             if match:
-                speaker_id = match.group(1)
-                timestamp = match.group(2)
-                speaker = f"发言人{speaker_id}"
-
+                if current and content_lines:
+                    current["text"] = "\n".join(content_lines)
+                    yield current
+                current = {
+                    "line_number": line_num,
+                    "timestamp": match.group(2),
+                    "speaker": f"发言人{match.group(1)}",
+                    "text": "",
+                    "original_line": line,
+                }
                 content_lines = []
-                j = i + 1
-
-                while j < len(lines):
-                    next_line = lines[j].strip()
-
-                    if not next_line:
-                        j += 1
-                        continue
-
-                    if re.match(r"^发言人\d+\s+\d{2}:\d{2}", next_line):
-                        break
-
-                    content_lines.append(next_line)
-                    j += 1
-
-                if content_lines:
-                    full_text = "\n".join(content_lines)
-                    segments.append(
-                        {
-                            "line_number": i + 1,
-                            "timestamp": timestamp,
-                            "speaker": speaker,
-                            "text": full_text,
-                            "original_line": line,
-                        }
-                    )
-
-                i = j
-            else:
-                i += 1
+            elif current:
+                content_lines.append(line)
 
-        return segments
+        if current and content_lines:
+            current["text"] = "\n".join(content_lines)
+            yield current
 
-    def _parse_timestamp_speaker_format(self, content: str) -> List[Dict]:
+    def _parse_timestamp_speaker_format(self, lines: Iterable[str]) -> Iterator[Dict]:
         """
         解析传统的时间戳+发言人格式
         """
-        lines = content.strip().split("\n")
-        segments = []
-
         for line_num, line in enumerate(lines, 1):
             line = line.strip()
             if not line or self._is_header_line(line):
@@ -123,17 +133,12 @@ class TextProcessor:
 
             segment = self._parse_traditional_line(line, line_num)
             if segment:
-                segments.append(segment)
+                yield segment
 
-        return segments
-
-    def _parse_mixed_format(self, content: str) -> List[Dict]:
+    def _parse_mixed_format(self, lines: Iterable[str]) -> Iterator[Dict]:
         """
         解析混合格式或纯文本格式
         """
-        lines = content.strip().split("\n")
-        segments = []
-
         for line_num, line in enumerate(lines, 1):
             line = line.strip()
             if not line or self._is_header_line(line):
@@ -150,16 +155,13 @@ class TextProcessor:
                     "original_line": line,
                 }
 
-            segments.append(segment)
-
-        return segments
+            yield segment
 
     def _parse_traditional_line(self, line: str, line_num: int) -> Dict:
         """
         解析传统格式的单行文本
         """
-        pattern1 = r"\[(\d{2}:\d{2}:\d{2}-\d{2}:\d{2}:\d{2})\]\s*([^:]+):\s*(.+)"
-        match1 = re.match(pattern1, line)
+        match1 = RANGE_SPEAKER_LINE_PATTERN.match(line)
         if match1:
             return {
                 "line_number": line_num,
@@ -169,8 +171,7 @@ class TextProcessor:
                 "original_line": line,
             }
 
-        pattern2 = r"\[(\d{2}:\d{2}:\d{2})\]\s*(.+)"
-        match2 = re.match(pattern2, line)
+        match2 = TIMESTAMP_LINE_PATTERN.match(line)
         if match2:
             return {
                 "line_number": line_num,
@@ -180,8 +181,7 @@ class TextProcessor:
                 "original_line": line,
             }
 
-        pattern3 = r"([^[]+)\[(\d{2}:\d{2}:\d{2})\]:\s*(.+)"
-        match3 = re.match(pattern3, line)
+        match3 = SPEAKER_BRACKET_LINE_PATTERN.match(line)
         if match3:
             return {
                 "line_number": line_num,
@@ -191,8 +191,7 @@ class TextProcessor:
                 "original_line": line,
             }
 
-        pattern4 = r"^(发言人\d+|[\u4e00-\u9fa5]{2,8})[:：]\s*(.+)"
-        match4 = re.match(pattern4, line)
+        match4 = SPEAKER_COLON_LINE_PATTERN.match(line)
         if match4:
             return {
                 "line_number": line_num,
@@ -204,23 +203,18 @@ class TextProcessor:
 
         return None
 
+    def header_rule(self, line: str) -> Optional[str]:
+        """
+        返回标题行或无关行命中的规则名，正常内容行返回 None
+        """
+        match = HEADER_PATTERN.match(line)
+        return match.lastgroup if match else None
+
     def _is_header_line(self, line: str) -> bool:
         """
         判断是否是标题行或无关行
         """
-        header_patterns = [
-            r"^chat-\d+",
-            r"^\d{4}年",
-            r"^=+$",
-            r"^-+$",
-            r"^文件|^转录|^记录",
-            r"^$",
-        ]
-
-        for pattern in header_patterns:
-            if re.match(pattern, line):
-                return True
-        return False
+        return HEADER_PATTERN.match(line) is not None
 
     def segment_long_text(self, text: str, max_length: int = 200) -> List[str]:
         """
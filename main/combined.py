@@ -1,6 +1,7 @@
 import argparse
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 
 def merge_json_files(
@@ -18,22 +19,115 @@ def merge_json_files(
     print(f"Successfully merged file: {output_path}")
 
 
-def process_batch(audio_dir: str, emotion_dir: str, output_dir: str) -> None:
+def is_up_to_date(output_path: str, *input_paths: str) -> bool:
+    """True if output_path exists and is newer than every input"""
+    if not os.path.exists(output_path):
+        return False
+    output_mtime = os.path.getmtime(output_path)
+    return all(os.path.getmtime(p) <= output_mtime for p in input_paths)
+
+
+def find_pairs(audio_dir: str, emotion_dir: str, output_dir: str) -> list:
+    """(chat_id, audio_path, emotion_path, output_path) for every complete pair"""
+    pairs = []
+    with os.scandir(audio_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith("_audio.json"):
+                continue
+            base_name = entry.name[: -len("_audio.json")]
+            emotion_path = os.path.join(emotion_dir, f"{base_name}_emotion.json")
+            if not os.path.exists(emotion_path):
+                continue
+            output_path = os.path.join(output_dir, f"{base_name}_merged.json")
+            pairs.append((base_name, entry.path, emotion_path, output_path))
+    return sorted(pairs)
+
+
+def write_consolidated(pairs: list, consolidated_path: str) -> None:
+    """
+    Stream every merged file into one JSONL file keyed by chat id.
+
+    A `<consolidated_path>.index.json` sidecar maps each chat id to the byte
+    offset of its line, so readers can seek to one chat without parsing the rest.
+    Both files are written to temp files first and renamed into place, data
+    before index, so the index is never newer than data it does not describe.
+    """
+    index = {}
+    index_path = consolidated_path + ".index.json"
+    tmp_path = consolidated_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for chat_id, _, _, output_path in pairs:
+            if not os.path.exists(output_path):
+                continue
+            with open(output_path, "r", encoding="utf-8") as f:
+                merged_data = json.load(f)
+            index[chat_id] = out.tell()
+            record = {"chat_id": chat_id, "data": merged_data}
+            out.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+    with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, consolidated_path)
+    os.replace(index_path + ".tmp", index_path)
+
+    print(f"Consolidated {len(index)} chats into {consolidated_path}")
+
+
+def is_consolidated(pairs: list, consolidated_path: str) -> bool:
+    """
+    True if the consolidated file and its index hold exactly the merged chats
+    on disk and are newer than every merged file.
+    """
+    index_path = consolidated_path + ".index.json"
+    merged = {
+        chat_id: output_path
+        for chat_id, _, _, output_path in pairs
+        if os.path.exists(output_path)
+    }
+    if not is_up_to_date(index_path, consolidated_path):
+        return False
+    if not is_up_to_date(consolidated_path, *merged.values()):
+        return False
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return set(json.load(f)) == set(merged)
+    except (OSError, json.JSONDecodeError):
+        return False
+
+
+def process_batch(
+    audio_dir: str,
+    emotion_dir: str,
+    output_dir: str,
+    workers: int = 1,
+    force: bool = False,
+    consolidated_path: str = None,
+) -> None:
     os.makedirs(output_dir, exist_ok=True)
-    audio_files = [f for f in os.listdir(audio_dir) if f.endswith("_audio.json")]
+    pairs = find_pairs(audio_dir, emotion_dir, output_dir)
 
-    if not audio_files:
+    if not pairs:
         print(f"No audio analysis files found in {audio_dir}")
         return
 
-    for audio_file in audio_files:
-        base_name = audio_file.replace("_audio.json", "")
-        audio_path = os.path.join(audio_dir, audio_file)
-        emotion_path = os.path.join(emotion_dir, f"{base_name}_emotion.json")
-        output_path = os.path.join(output_dir, f"{base_name}_merged.json")
-        if not os.path.exists(emotion_path):
-            continue
-        merge_json_files(audio_path, emotion_path, output_path)
+    todo = [
+        (audio_path, emotion_path, output_path)
+        for _, audio_path, emotion_path, output_path in pairs
+        if force or not is_up_to_date(output_path, audio_path, emotion_path)
+    ]
+    print(f"{len(pairs) - len(todo)} merged files are up to date, {len(todo)} to merge")
+
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(merge_json_files, *zip(*todo), chunksize=16))
+    else:
+        for audio_path, emotion_path, output_path in todo:
+            merge_json_files(audio_path, emotion_path, output_path)
+
+    if consolidated_path:
+        if todo or not is_consolidated(pairs, consolidated_path):
+            write_consolidated(pairs, consolidated_path)
+        else:
+            print(f"{consolidated_path} is up to date")
 
     print("Done!")
 
@@ -50,6 +144,8 @@ def main():
     )
     parser.add_argument(
         "--emotion_dir",
+        "--input_dir",
+        dest="emotion_dir",
         type=str,
         required=True,
         help="Directory containing emotion timeline files (format: *_emotion.json)",
@@ -60,9 +156,33 @@ def main():
         required=True,
         help="Output directory for merged files (format: *_merged.json)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of merge processes",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Merge every pair, even when the merged file is newer than its inputs",
+    )
+    parser.add_argument(
+        "--consolidated",
+        type=str,
+        default=None,
+        help="Also write all merged results to this JSONL file keyed by chat id",
+    )
 
     args = parser.parse_args()
-    process_batch(args.audio_dir, args.emotion_dir, args.output_dir)
+    process_batch(
+        args.audio_dir,
+        args.emotion_dir,
+        args.output_dir,
+        workers=args.workers,
+        force=args.force,
+        consolidated_path=args.consolidated,
+    )
 
 
 if __name__ == "__main__":
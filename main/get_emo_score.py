@@ -1,13 +1,192 @@
 import argparse
 import asyncio
+import csv
+import hashlib
 import json
 import os
+import random
 import re
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 from openai import OpenAI
 from tqdm import tqdm
 
-from utils import call_embedding, cosine_similarity, load_json, load_yaml_config
+from utils import (
+    VectorIndex,
+    atomic_write,
+    call_embedding,
+    cosine_similarity,
+    file_digest,
+    load_json,
+    load_yaml_config,
+    read_manifest,
+    write_manifest,
+)
+
+# Caps in-flight embedding/judge requests across all files, set in main().
+api_semaphore = None
+# Packs concurrent judge calls into numbered multi-pair prompts, set in main().
+judge_batcher = None
+# Cosine bands where the judge decision is inferred without a call, set in main().
+judge_bands = None
+# Records or replays judge decisions and embeddings, set in main().
+trace_store = None
+# Faiss index type for large candidate pools, set in main().
+index_type = "flat"
+# Candidate pools at least this large are searched through a VectorIndex
+# instead of a linear cosine scan.
+INDEX_MIN_POOL = 256
+# Bump when the scoring logic changes, so persisted results are recomputed
+SCORER_VERSION = "1"
+
+BATCH_JUDGE_PROMPT = """
+你是一个负责对比文本的评测器。
+我会给你若干组编号的文本A和B，你需要逐组判断它们语义是否相似，或者在描述一个相似的态度和事件。
+如果语义基本一致或高度近似(意思相或者目标相同)，该组输出1，否则输出0。
+
+### 注意
+- 每组输出一行，格式为"编号. 数字"，数字只能是0或1。
+- 必须按编号顺序输出所有组，不要输出其他解释。
+
+### 输入示例
+
+1. 文本A: 我爱吃苹果
+   文本B: 我觉得苹果很好吃
+2. 文本A: 今天下雨了
+   文本B: 我明天要考试
+
+### 输出示例
+
+1. 1
+2. 0
+
+"""
+BATCH_DECISION_PATTERN = re.compile(r"^\s*(\d+)\s*[.:：、)]?\s*([01])\s*$")
+
+
+async def call_api(func, *args, **kwargs):
+    """Run a blocking API call in a worker thread under the global API semaphore"""
+    if api_semaphore is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    async with api_semaphore:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+class TraceStore:
+    """
+    Trace of every embedding vector and judge decision of an evaluation.
+
+    In "record" mode the API results are appended to embeddings.jsonl and
+    judgements.jsonl in trace_dir. In "replay" mode they are served from those
+    files and a missing entry raises KeyError, so no network call is ever made.
+    Entries are keyed by model and text, so a trace can be replayed with other
+    thresholds or metric code as long as the same texts are compared.
+    Decisions inferred by JudgeBands are recorded with source "band", so a
+    trace recorded with bands also replays without them; a decision from the
+    judge always takes precedence over an inferred one.
+    """
+
+    def __init__(self, trace_dir, mode):
+        self.trace_dir = trace_dir
+        self.mode = mode
+        self.embeddings = {}
+        self.judgements = {}
+        self.sources = {}
+        os.makedirs(trace_dir, exist_ok=True)
+        for name, table in (
+            ("embeddings", self.embeddings),
+            ("judgements", self.judgements),
+        ):
+            path = os.path.join(trace_dir, f"{name}.jsonl")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            if name == "judgements" and not self._overrides(
+                                record["key"], record.get("source", "judge")
+                            ):
+                                continue
+                            table[record["key"]] = record["value"]
+                            if name == "judgements":
+                                self.sources[record["key"]] = record.get(
+                                    "source", "judge"
+                                )
+        self.files = {}
+        if mode == "record":
+            self.files = {
+                name: open(
+                    os.path.join(trace_dir, f"{name}.jsonl"), "a", encoding="utf-8"
+                )
+                for name in ("embeddings", "judgements")
+            }
+
+    @staticmethod
+    def _key(*parts):
+        text = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def embedding_key(self, text, embed_config):
+        return self._key(
+            embed_config.get("backend", "openai"), embed_config.get("model"), text
+        )
+
+    def judgement_key(self, text_a, text_b, judge_config):
+        return self._key(judge_config.get("model"), text_a, text_b)
+
+    def _write(self, name, table, key, value, **fields):
+        table[key] = value
+        f = self.files[name]
+        f.write(
+            json.dumps({"key": key, **fields, "value": value}, ensure_ascii=False)
+            + "\n"
+        )
+        f.flush()
+
+    def embedding(self, text, embed_config):
+        key = self.embedding_key(text, embed_config)
+        if key not in self.embeddings:
+            raise KeyError(f"No recorded embedding for {text!r}")
+        return self.embeddings[key]
+
+    def record_embedding(self, text, embed_config, embedding):
+        key = self.embedding_key(text, embed_config)
+        # Texts repeat across chats; every vector is stored once
+        if key not in self.embeddings:
+            embedding = [float(x) for x in embedding]
+            self._write("embeddings", self.embeddings, key, embedding, text=text)
+
+    def judgement(self, text_a, text_b, judge_config):
+        key = self.judgement_key(text_a, text_b, judge_config)
+        if key not in self.judgements:
+            raise KeyError(f"No recorded judge decision for {text_a!r} / {text_b!r}")
+        return self.judgements[key]
+
+    def _overrides(self, key, source):
+        # Inferred decisions never replace one made by the judge
+        return not (source == "band" and self.sources.get(key) == "judge")
+
+    def record_judgement(self, text_a, text_b, judge_config, decision, source="judge"):
+        key = self.judgement_key(text_a, text_b, judge_config)
+        if not self._overrides(key, source):
+            return
+        # A changed decision is appended again; the last one wins on replay
+        if self.judgements.get(key) != decision or self.sources.get(key) != source:
+            self.sources[key] = source
+            self._write(
+                "judgements",
+                self.judgements,
+                key,
+                decision,
+                text_a=text_a,
+                text_b=text_b,
+                source=source,
+            )
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
 
 
 async def judge_similarity_with_llm(text_a, text_b, judge_config):
@@ -19,7 +198,24 @@ async def judge_similarity_with_llm(text_a, text_b, judge_config):
     In this work, we used the [GLM-4-Plus](https://arxiv.org/abs/2406.12793).
 
     Changing the LLM may affect the actual score evaluation, and a certain range of error is considered normal.
+
+    When batched judging is enabled, the pair is queued and judged together with
+    other concurrent pairs in one request. Decisions go through trace_store when
+    recording or replaying.
     """
+    if trace_store is not None and trace_store.mode == "replay":
+        return trace_store.judgement(text_a, text_b, judge_config)
+    if judge_batcher is not None:
+        decision = await judge_batcher.judge(text_a, text_b)
+    else:
+        decision = await judge_pair_with_llm(text_a, text_b, judge_config)
+    if trace_store is not None:
+        trace_store.record_judgement(text_a, text_b, judge_config, decision)
+    return decision
+
+
+async def judge_pair_with_llm(text_a, text_b, judge_config):
+    """Judge a single pair with one chat completion"""
     messages = [
         {
             "role": "system",
@@ -51,7 +247,7 @@ async def judge_similarity_with_llm(text_a, text_b, judge_config):
     ]
     client = OpenAI(api_key=judge_config["api_key"], base_url=judge_config["base_url"])
 
-    response = await asyncio.to_thread(
+    response = await call_api(
         client.chat.completions.create,
         model=judge_config["model"],
         messages=messages,
@@ -62,8 +258,246 @@ async def judge_similarity_with_llm(text_a, text_b, judge_config):
     return 1 if val == 1 else 0
 
 
+class JudgeBands:
+    """
+    Infer the judge decision from the embedding similarity outside [low, high):
+    1 at or above `high`, 0 below `low`. Only the ambiguous middle band calls
+    the LLM. A `sample_rate` fraction of the inferred decisions is still sent
+    to the judge to measure how often the shortcut agrees with it.
+    """
+
+    def __init__(self, low=None, high=None, sample_rate=0.0, seed=0):
+        self.low = low
+        self.high = high
+        self.sample_rate = sample_rate
+        self.rng = random.Random(seed)
+        self.counts = {"high": 0, "low": 0, "judged": 0}
+        self.calibration = {
+            "high": {"sampled": 0, "agree": 0},
+            "low": {"sampled": 0, "agree": 0},
+        }
+
+    def band(self, sim):
+        if self.high is not None and sim >= self.high:
+            return "high"
+        if self.low is not None and sim < self.low:
+            return "low"
+        return None
+
+    async def judge(self, text_a, text_b, sim, judge_config):
+        band = self.band(sim)
+        if band is None:
+            self.counts["judged"] += 1
+            return await judge_similarity_with_llm(text_a, text_b, judge_config)
+
+        self.counts[band] += 1
+        decision = 1 if band == "high" else 0
+        if trace_store is not None and trace_store.mode == "record":
+            trace_store.record_judgement(
+                text_a, text_b, judge_config, decision, source="band"
+            )
+        if self.rng.random() < self.sample_rate:
+            actual = await judge_similarity_with_llm(text_a, text_b, judge_config)
+            self.calibration[band]["sampled"] += 1
+            self.calibration[band]["agree"] += int(actual == decision)
+        return decision
+
+    def report(self):
+        bands = {}
+        for band, stats in self.calibration.items():
+            sampled = stats["sampled"]
+            bands[band] = {
+                **stats,
+                "agreement": round(stats["agree"] / sampled, 4) if sampled else None,
+            }
+        total = sum(self.counts.values())
+        return {
+            "low": self.low,
+            "high": self.high,
+            "sample_rate": self.sample_rate,
+            "decisions": self.counts,
+            "skipped_ratio": round(
+                (self.counts["high"] + self.counts["low"]) / total, 4
+            )
+            if total
+            else 0.0,
+            "calibration": bands,
+        }
+
+
+async def judge_with_bands(text_a, text_b, sim, judge_config):
+    """Judge a matched pair, short-circuiting through judge_bands when enabled"""
+    if judge_bands is None:
+        return await judge_similarity_with_llm(text_a, text_b, judge_config)
+    return await judge_bands.judge(text_a, text_b, sim, judge_config)
+
+
+def parse_batch_decisions(content, num_pairs):
+    """Map pair number to 0/1 for every well-formed "N. 0|1" line of a batch reply"""
+    decisions = {}
+    for line in content.splitlines():
+        match = BATCH_DECISION_PATTERN.match(line)
+        if match and 1 <= int(match.group(1)) <= num_pairs:
+            decisions[int(match.group(1))] = int(match.group(2))
+    return decisions
+
+
+class BatchJudge:
+    """
+    Collect judge calls made concurrently and send them as one numbered prompt.
+
+    A batch is sent once it holds batch_size pairs or max_wait seconds after its
+    first pair arrived. Pairs whose line cannot be parsed from the reply are
+    re-judged one by one with judge_pair_with_llm.
+    """
+
+    def __init__(self, judge_config, batch_size=20, max_wait=0.05):
+        self.judge_config = judge_config
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.pending = []
+        self.flush_handle = None
+        # The event loop only keeps weak references to tasks; hold in-flight
+        # batches here so none is garbage-collected before its futures resolve
+        self._tasks = set()
+        self.num_requests = 0
+        self.num_fallbacks = 0
+
+    async def judge(self, text_a, text_b):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((text_a, text_b, future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.max_wait, self.flush)
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.ensure_future(self.run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def run_batch(self, batch):
+        pairs = "\n".join(
+            f"{i}. 文本A: {a}\n   文本B: {b}" for i, (a, b, _) in enumerate(batch, 1)
+        )
+        messages = [
+            {"role": "system", "content": BATCH_JUDGE_PROMPT},
+            {
+                "role": "user",
+                "content": f"{pairs}\n请逐组判断是否相似(0或1)，共{len(batch)}组:",
+            },
+        ]
+        client = OpenAI(
+            api_key=self.judge_config["api_key"],
+            base_url=self.judge_config["base_url"],
+        )
+        self.num_requests += 1
+        try:
+            response = await call_api(
+                client.chat.completions.create,
+                model=self.judge_config["model"],
+                messages=messages,
+                temperature=0.0,
+            )
+            decisions = parse_batch_decisions(
+                response.choices[0].message.content, len(batch)
+            )
+        except Exception as e:
+            print(f"[WARN] Batched judge request failed ({e}), judging pairs singly")
+            decisions = {}
+
+        fallbacks = []
+        for i, (a, b, future) in enumerate(batch, 1):
+            if i in decisions:
+                future.set_result(decisions[i])
+            else:
+                fallbacks.append((a, b, future))
+        self.num_fallbacks += len(fallbacks)
+        self.num_requests += len(fallbacks)
+
+        async def judge_single(a, b, future):
+            try:
+                future.set_result(await judge_pair_with_llm(a, b, self.judge_config))
+            except Exception as e:
+                future.set_exception(e)
+
+        await asyncio.gather(*(judge_single(a, b, f) for a, b, f in fallbacks))
+
+
+async def embed_texts(texts, embed_config, max_length=64):
+    """Embed texts in parallel chunks of at most max_length inputs"""
+    if trace_store is not None and trace_store.mode == "replay":
+        return [trace_store.embedding(text, embed_config) for text in texts]
+    # FIXME: ZhipuAI Embedding-3 API Only supports 64 groups of text, so we need to split the text into chunks.
+    chunks = [texts[i : i + max_length] for i in range(0, len(texts), max_length)]
+    chunk_embs = await asyncio.gather(
+        *(call_api(call_embedding, chunk, **embed_config) for chunk in chunks)
+    )
+    embeddings = [emb for embs in chunk_embs for emb in embs]
+    if trace_store is not None:
+        for text, emb in zip(texts, embeddings):
+            trace_store.record_embedding(text, embed_config, emb)
+    return embeddings
+
+
+class CandidatePool:
+    """
+    Embedded predictions (events or reasons) that GT items are matched against.
+    The pool is embedded once and reused for every GT item; large pools are
+    searched through a VectorIndex.
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.index = None
+        if len(embeddings) >= INDEX_MIN_POOL:
+            self.index = VectorIndex(len(embeddings[0]), index_type=index_type)
+            self.index.add(np.stack(embeddings))
+
+    @classmethod
+    async def build(cls, texts, embed_config):
+        return cls(await embed_texts(texts, embed_config) if texts else [])
+
+    def best_match(self, query_emb):
+        """(position, cosine) of the most similar candidate, (None, 0.0) if none is positive"""
+        if self.index is not None:
+            sims, ids = self.index.search(query_emb, k=1)
+            if ids[0][0] >= 0 and sims[0][0] > 0:
+                return int(ids[0][0]), float(sims[0][0])
+            return None, 0.0
+
+        best_idx, best_sim = None, 0.0
+        for i, emb in enumerate(self.embeddings):
+            sim = cosine_similarity(query_emb, emb)
+            if sim > best_sim:
+                best_idx, best_sim = i, sim
+        return best_idx, best_sim
+
+
+def normalize_pred_emotions(pred_emotions):
+    """Predicted emotions as a list, or None when the prediction is an empty placeholder"""
+    if type(pred_emotions) is dict:
+        pred_emotions = [pred_emotions]
+    if len(pred_emotions) == 1 and pred_emotions[0] == {}:
+        return None
+    return pred_emotions
+
+
 async def match_event(
-    gt_event_text, pred_events, embed_config, judge_config, event_threshold=0.3
+    gt_event_text,
+    pred_events,
+    embed_config,
+    judge_config,
+    event_threshold=0.3,
+    pred_pool=None,
+    gt_emb=None,
 ):
     """
     Calculate and match event similarity, and return the most similar event along with its similarity score.
@@ -71,29 +505,29 @@ async def match_event(
     2. Use embedding and LLM models to match the most similar event.
     Return two scores: embedding score and LLM score.
 
+    pred_pool and gt_emb may be passed in when they were already embedded, e.g. when
+    several GT events are matched against the same predicted events.
+
     Note: The default value of event_threshold=0.3 makes it easy to compare two events with some similarity. In this work, this is done to allow answers from the large model to enter the event pool for matching, as the events generated by the large model often have some differences compared to the ground truth (GT).
     This could lead to potential drawbacks, as it might not fully filter out irrelevant events, which often causes the LLM’s scores to be higher than expected.
     """
     if not pred_events:
         return None, 0.0, 0.0
 
-    texts_to_embed = [gt_event_text] + [pe["event"] for pe in pred_events]
-    embs = call_embedding(texts_to_embed, **embed_config)
-    gt_emb = embs[0]
-    pred_embs = embs[1:]
+    if pred_pool is None:
+        pred_pool = await CandidatePool.build(
+            [pe["event"] for pe in pred_events], embed_config
+        )
+    if gt_emb is None:
+        gt_emb = (await embed_texts([gt_event_text], embed_config))[0]
 
-    best_sim = 0.0
-    best_event = None
-    for i, pred_ev in enumerate(pred_events):
-        sim = cosine_similarity(gt_emb, pred_embs[i])
-        if sim > best_sim:
-            best_sim = sim
-            best_event = pred_ev
+    best_idx, best_sim = pred_pool.best_match(gt_emb)
+    best_event = pred_events[best_idx] if best_idx is not None else None
 
     llm_sim = 0
     if best_event is not None:
-        llm_sim = await judge_similarity_with_llm(
-            gt_event_text, best_event["event"], judge_config
+        llm_sim = await judge_with_bands(
+            gt_event_text, best_event["event"], best_sim, judge_config
         )
 
     if best_sim < event_threshold and llm_sim < event_threshold:
@@ -102,11 +536,16 @@ async def match_event(
         return best_event, best_sim, llm_sim
 
 
-async def match_emotion(gt_emotion, pred_emotions, embed_config, judge_config):
+async def match_emotion(
+    gt_emotion, pred_emotions, embed_config, judge_config, pred_pool=None, gt_emb=None
+):
     """
     Match sentiment, evaluate state, reason, and source_id.
     1. Use embedding model to calculate the similarity of reason.
     2. Use LLM model to determine reason similarity and return two scores.
+
+    pred_pool (embedded predicted reasons) and gt_emb may be passed in when they
+    were already embedded.
     """
     gt_state = gt_emotion["state"]
     gt_reason = gt_emotion["reason"]
@@ -124,41 +563,30 @@ async def match_emotion(gt_emotion, pred_emotions, embed_config, judge_config):
         "reason_embed_score": 0,
         "reason_llm_score": 0,
     }
-    if type(pred_emotions) is dict:
-        pred_emotions = [pred_emotions]
-    if len(pred_emotions) == 1 and pred_emotions[0] == {}:
+    pred_emotions = normalize_pred_emotions(pred_emotions)
+    if pred_emotions is None:
         return emo_res, 0
 
     matched_idx = None
+    if not pred_emotions:
+        return emo_res, matched_idx
 
-    max_length = 64
-    texts_to_embed = [gt_reason] + [e["reason"] for e in pred_emotions]
-
-    def chunk_texts(texts, max_length):
-        return [texts[i : i + max_length] for i in range(0, len(texts), max_length)]
-
-    chunked_texts = chunk_texts(texts_to_embed, max_length)
-    embeddings = []
-
-    # FIXME: ZhipuAI Embedding-3 API Only supports 64 groups of text, so we need to split the text into chunks.
-    for chunk in chunked_texts:
-        embs = call_embedding(chunk, **embed_config)
-        embeddings.extend(embs)  # Append the embeddings from each chunk
-    gt_emb = embeddings[0]
-    pred_embs = embeddings[1:]
+    if pred_pool is None:
+        pred_pool = await CandidatePool.build(
+            [e["reason"] for e in pred_emotions], embed_config
+        )
+    if gt_emb is None:
+        gt_emb = (await embed_texts([gt_reason], embed_config))[0]
 
-    best_sim = 0.0
     best_pair = None
-    for i, pred_emo in enumerate(pred_emotions):
-        sim = cosine_similarity(gt_emb, pred_embs[i])
-        if sim > best_sim:
-            best_sim = sim
-            best_pair = (i, pred_emo)
+    best_idx, best_sim = pred_pool.best_match(gt_emb)
+    if best_idx is not None:
+        best_pair = (best_idx, pred_emotions[best_idx])
 
     if best_pair:
         matched_idx, best_pred_emo = best_pair
-        llm_reason_sim = await judge_similarity_with_llm(
-            gt_reason, best_pred_emo["reason"], judge_config
+        llm_reason_sim = await judge_with_bands(
+            gt_reason, best_pred_emo["reason"], best_sim, judge_config
         )
 
         # FIXME: llm_reason only has two cases, 0 and 1. This can be optimized in the future by adding embedding computation.
@@ -217,11 +645,79 @@ async def evaluate_chain(
 
         total_role_possible_score = 0.0
 
-        for gt_ev in gt_events:
-            gt_event_text = gt_ev["event"]
-            best_pred_event, event_sim, llm_sim = await match_event(
-                gt_event_text, pred_events, embed_config, judge_config, event_threshold
+        # The role's GT events and predicted events are embedded once. All events
+        # are then matched concurrently, then all emotions of the matched events;
+        # the API semaphore bounds the actual request rate.
+        gt_event_embs, pred_pool = await asyncio.gather(
+            embed_texts([gt_ev["event"] for gt_ev in gt_events], embed_config)
+            if gt_events and pred_events
+            else asyncio.sleep(0, result=[None] * len(gt_events)),
+            CandidatePool.build([pe["event"] for pe in pred_events], embed_config),
+        )
+        event_matches = await asyncio.gather(
+            *(
+                match_event(
+                    gt_ev["event"],
+                    pred_events,
+                    embed_config,
+                    judge_config,
+                    event_threshold,
+                    pred_pool=pred_pool,
+                    gt_emb=gt_emb,
+                )
+                for gt_ev, gt_emb in zip(gt_events, gt_event_embs)
             )
+        )
+
+        # Several GT events can match the same predicted event; embed its reasons once
+        reason_pools = {}
+
+        def reason_pool(pred_event, pred_emotions):
+            key = id(pred_event)
+            if key not in reason_pools:
+                reason_pools[key] = asyncio.ensure_future(
+                    CandidatePool.build(
+                        [e["reason"] for e in pred_emotions], embed_config
+                    )
+                )
+            return reason_pools[key]
+
+        async def match_event_emotions(gt_ev, best_pred_event):
+            if not best_pred_event:
+                return []
+            gt_emotions = gt_ev.get("emotions", [])
+            pred_emotions = normalize_pred_emotions(best_pred_event.get("emotions", []))
+            pool, gt_embs = None, [None] * len(gt_emotions)
+            if pred_emotions and gt_emotions:
+                pool, gt_embs = await asyncio.gather(
+                    reason_pool(best_pred_event, pred_emotions),
+                    embed_texts([e["reason"] for e in gt_emotions], embed_config),
+                )
+            return await asyncio.gather(
+                *(
+                    match_emotion(
+                        gt_em,
+                        best_pred_event.get("emotions", []),
+                        embed_config,
+                        judge_config,
+                        pred_pool=pool,
+                        gt_emb=gt_emb,
+                    )
+                    for gt_em, gt_emb in zip(gt_emotions, gt_embs)
+                )
+            )
+
+        emotion_matches = await asyncio.gather(
+            *(
+                match_event_emotions(gt_ev, best_pred_event)
+                for gt_ev, (best_pred_event, _, _) in zip(gt_events, event_matches)
+            )
+        )
+
+        for gt_ev, (best_pred_event, event_sim, llm_sim), emo_results in zip(
+            gt_events, event_matches, emotion_matches
+        ):
+            gt_event_text = gt_ev["event"]
 
             event_score = event_sim if best_pred_event else 0
             llm_event_score = llm_sim if best_pred_event else 0
@@ -230,13 +726,7 @@ async def evaluate_chain(
             num_emotions = len(gt_ev.get("emotions", []))
 
             if best_pred_event:
-                for gt_em in gt_ev.get("emotions", []):
-                    emo_res, _ = await match_emotion(
-                        gt_em,
-                        best_pred_event.get("emotions", []),
-                        embed_config,
-                        judge_config,
-                    )
+                for emo_res, _ in emo_results:
                     emo_matches.append(emo_res)
 
                     total_role_state_score += (
@@ -313,6 +803,321 @@ async def evaluate_chain(
     }
 
 
+def scoring_config(args, embed_config, judge_config):
+    """Everything besides the GT and prediction files that changes a file's scores"""
+    return {
+        "scorer_version": SCORER_VERSION,
+        "event_threshold": args.event_threshold,
+        "embedding": {k: v for k, v in embed_config.items() if k != "api_key"},
+        "llm": {k: v for k, v in judge_config.items() if k != "api_key"},
+        "judge_low": args.judge_low,
+        "judge_high": args.judge_high,
+        "judge_batch_size": args.judge_batch_size,
+        "index_type": args.index_type,
+        "trace": trace_store.mode if trace_store else None,
+    }
+
+
+def record_manifest(output_dir, idx, gt_file_path, pred_file_path, config):
+    """Record the inputs and config an evaluation file was produced from"""
+    entry = {
+        "gt_file": gt_file_path,
+        "gt_hash": file_digest(gt_file_path),
+        "pred_file": pred_file_path,
+        "pred_hash": file_digest(pred_file_path),
+        "config": config,
+    }
+    write_manifest(output_dir, f"evaluation_{idx}", entry)
+
+
+def is_up_to_date(output_dir, idx, gt_file_path, pred_file_path, config):
+    """
+    True if evaluation_{idx}.json is on disk and was scored from the same GT and
+    prediction contents with the same config.
+    """
+    out_file_path = os.path.join(output_dir, f"evaluation_{idx}.json")
+    entry = read_manifest(output_dir, f"evaluation_{idx}")
+    if entry is None or not os.path.exists(out_file_path):
+        return False
+    try:
+        return (
+            entry.get("gt_hash") == file_digest(gt_file_path)
+            and entry.get("pred_hash") == file_digest(pred_file_path)
+            and entry.get("config") == json.loads(json.dumps(config))
+        )
+    except OSError:
+        return False
+
+
+# (percentage key, score key of total_score, short name) of the reported metrics
+METRICS = [
+    ("total_state_score_percentage", "total_state_score", "SA"),
+    ("total_source_id_score_percentage", "total_source_id_score", "SIA"),
+    ("total_reason_embed_score_percentage", "total_reason_mbed_score", "RC_embed"),
+    ("total_reason_llm_score_percentage", "total_reason_llm_score", "RC_LLM"),
+]
+# Emotion scores behind each metric, in METRICS order
+EMOTION_SCORE_KEYS = [
+    "state_score",
+    "source_id_score",
+    "reason_embed_score",
+    "reason_llm_score",
+]
+
+
+def role_scores(result):
+    """Percentage of every metric per role of an evaluate_chain result"""
+    roles = {}
+    for role, role_details in result["details"].items():
+        events = role_details["events"]
+        if not events:
+            continue
+        scores = np.zeros(len(EMOTION_SCORE_KEYS))
+        for event in events:
+            for emo_res in event["emotions"]:
+                scores += [
+                    emo_res[key] / len(event["emotions"]) / len(events)
+                    for key in EMOTION_SCORE_KEYS
+                ]
+        roles[role] = scores * 100
+    return roles
+
+
+def event_totals(result):
+    """
+    Emotion scores of an evaluate_chain result summed over its GT events, each
+    event weighted equally across roles, and the number of GT events
+    """
+    scores = np.zeros(len(EMOTION_SCORE_KEYS))
+    num_events = 0
+    for role_details in result["details"].values():
+        for event in role_details["events"]:
+            num_events += 1
+            for emo_res in event["emotions"]:
+                scores += [
+                    emo_res[key] / len(event["emotions"]) for key in EMOTION_SCORE_KEYS
+                ]
+    return scores, num_events
+
+
+class SummaryAggregator:
+    """
+    Running summary of per-chat evaluation results, keyed by chat id.
+
+    Reports the macro average (mean of per-chat percentages, as before), the
+    micro average (pooled over all GT events of all chats, every event weighted
+    equally), percentile bootstrap confidence intervals of both, and macro
+    averages per role.
+    """
+
+    def __init__(self, num_bootstrap=1000, confidence=0.95, seed=0):
+        self.num_bootstrap = num_bootstrap
+        self.confidence = confidence
+        self.seed = seed
+        self.percentages = {}
+        self.scores = {}
+        self.possible = {}
+        self.roles = {}
+
+    def __len__(self):
+        return len(self.percentages)
+
+    def add(self, chat_id, result):
+        total_score = result["total_score"]
+        self.percentages[chat_id] = np.array(
+            [total_score[key] for key, _, _ in METRICS], dtype=np.float64
+        )
+        self.scores[chat_id], self.possible[chat_id] = event_totals(result)
+        self.roles[chat_id] = role_scores(result)
+
+    @staticmethod
+    def _metrics(values):
+        return {key: round(float(v), 2) for (key, _, _), v in zip(METRICS, values)}
+
+    def _bootstrap(self, percentages, scores, possible):
+        """Percentile intervals of the macro and micro averages over resampled chats"""
+        rng = np.random.default_rng(self.seed)
+        num_chats = len(percentages)
+        # Every row holds how often each chat was drawn in one resample
+        counts = rng.multinomial(
+            num_chats, np.full(num_chats, 1 / num_chats), size=self.num_bootstrap
+        )
+        macro = counts @ percentages / num_chats
+        pooled_possible = counts @ possible
+        micro = np.divide(
+            (counts @ scores) * 100,
+            pooled_possible[:, None],
+            out=np.zeros((self.num_bootstrap, len(METRICS))),
+            where=pooled_possible[:, None] > 0,
+        )
+        alpha = (1 - self.confidence) / 2 * 100
+        intervals = {}
+        for name, samples in (("macro", macro), ("micro", micro)):
+            low, high = np.percentile(samples, [alpha, 100 - alpha], axis=0)
+            intervals[name] = {
+                key: [round(float(lo), 2), round(float(hi), 2)]
+                for (key, _, _), lo, hi in zip(METRICS, low, high)
+            }
+        return intervals
+
+    def summary(self, partial=False):
+        chat_ids = sorted(self.percentages, key=int)
+        percentages = np.array(
+            [self.percentages[c] for c in chat_ids], dtype=np.float64
+        ).reshape(-1, len(METRICS))
+        scores = np.array([self.scores[c] for c in chat_ids]).reshape(-1, len(METRICS))
+        possible = np.array([self.possible[c] for c in chat_ids], dtype=np.float64)
+
+        macro = percentages.mean(axis=0) if chat_ids else np.zeros(len(METRICS))
+        total_possible = possible.sum()
+        micro = (
+            scores.sum(axis=0) / total_possible * 100
+            if total_possible > 0
+            else np.zeros(len(METRICS))
+        )
+
+        role_values = {}
+        for chat_id in chat_ids:
+            for role, values in self.roles[chat_id].items():
+                role_values.setdefault(role, []).append(values)
+        roles = {
+            role: {
+                **self._metrics(np.mean(values, axis=0)),
+                "num_chats": len(values),
+            }
+            for role, values in sorted(role_values.items())
+        }
+
+        summary = {
+            "partial": partial,
+            "num_chats": len(chat_ids),
+            "num_events": int(total_possible),
+            "average_score": self._metrics(macro),
+            "micro_average_score": self._metrics(micro),
+        }
+        if self.num_bootstrap > 0 and chat_ids:
+            summary["confidence_interval"] = {
+                "confidence": self.confidence,
+                "num_bootstrap": self.num_bootstrap,
+                **self._bootstrap(percentages, scores, possible),
+            }
+        summary["roles"] = roles
+        summary["details"] = [
+            {
+                "data_set": f"data_{chat_id}",
+                **self._metrics(self.percentages[chat_id]),
+            }
+            for chat_id in chat_ids
+        ]
+        return summary
+
+    def write(self, path, partial=False):
+        summary = self.summary(partial)
+        atomic_write(path, json.dumps(summary, ensure_ascii=False, indent=2))
+        return summary
+
+
+def parse_thresholds(spec):
+    """'0.1,0.3,0.5' or 'start:stop:step' (stop included) as a float array"""
+    if ":" in spec:
+        start, stop, step = (float(x) for x in spec.split(":"))
+        return np.round(np.arange(start, stop + step / 2, step), 6)
+    return np.array([float(x) for x in spec.split(",")])
+
+
+def event_score_arrays(result):
+    """
+    Per GT event of an evaluate_chain result scored without a threshold: the
+    embedding and judge similarity of its best match, and the weighted emotion
+    scores it adds when the match is accepted.
+    Returns (sims, llm_sims, contributions of shape (events, 4), possible score).
+    """
+    sims, llm_sims, contributions = [], [], []
+    possible = 0.0
+    for role_details in result["details"].values():
+        events = role_details["events"]
+        for event in events:
+            contribution = np.zeros(len(EMOTION_SCORE_KEYS))
+            for emo_res in event["emotions"]:
+                contribution += [
+                    emo_res[key] / len(event["emotions"]) / len(events)
+                    for key in EMOTION_SCORE_KEYS
+                ]
+            sims.append(event["event_similarity"])
+            llm_sims.append(event["llm_event_score"])
+            contributions.append(contribution)
+            possible += 1 / len(events)
+    return (
+        np.array(sims, dtype=np.float64),
+        np.array(llm_sims, dtype=np.float64),
+        np.array(contributions, dtype=np.float64).reshape(-1, len(EMOTION_SCORE_KEYS)),
+        possible,
+    )
+
+
+def sweep_scores(file_arrays, thresholds):
+    """
+    Average SA/SIA/RC_embed/RC_LLM percentages over files for every threshold.
+
+    A best match is accepted at threshold t when its embedding or judge
+    similarity reaches t, as in match_event. All files and thresholds are
+    evaluated at once; returns an array of shape (len(thresholds), 4).
+    """
+    if not file_arrays:
+        return np.zeros((len(thresholds), len(METRICS)))
+    sims = np.concatenate([a[0] for a in file_arrays])
+    llm_sims = np.concatenate([a[1] for a in file_arrays])
+    contributions = np.concatenate([a[2] for a in file_arrays])
+    possible = np.array([a[3] for a in file_arrays])
+    file_ids = np.repeat(np.arange(len(file_arrays)), [len(a[0]) for a in file_arrays])
+
+    # (thresholds, events)
+    accepted = (sims[None, :] >= thresholds[:, None]) | (
+        llm_sims[None, :] >= thresholds[:, None]
+    )
+    # (thresholds, files, metrics)
+    scores = np.zeros((len(thresholds), len(file_arrays), contributions.shape[1]))
+    np.add.at(
+        scores,
+        (slice(None), file_ids),
+        accepted[:, :, None] * contributions[None, :, :],
+    )
+    percentages = np.zeros_like(scores)
+    np.divide(
+        scores * 100,
+        possible[None, :, None],
+        out=percentages,
+        where=possible[None, :, None] > 0,
+    )
+    # evaluate_chain rounds every file before the summary averages them
+    return np.round(np.round(percentages, 2).mean(axis=1), 2)
+
+
+def write_sweep(output_dir, thresholds, table):
+    """Write the threshold sweep to sweep.csv and sweep.json"""
+    columns = [column for _, _, column in METRICS]
+    with open(
+        os.path.join(output_dir, "sweep.csv"), "w", encoding="utf-8", newline=""
+    ) as f:
+        writer = csv.writer(f)
+        writer.writerow(["event_threshold", *columns])
+        for threshold, row in zip(thresholds, table):
+            writer.writerow([f"{threshold:g}", *(f"{v:.2f}" for v in row)])
+    sweep = [
+        {
+            "event_threshold": float(threshold),
+            **{key: float(v) for (key, _, _), v in zip(METRICS, row)},
+        }
+        for threshold, row in zip(thresholds, table)
+    ]
+    with open(os.path.join(output_dir, "sweep.json"), "w", encoding="utf-8") as f:
+        json.dump(sweep, f, ensure_ascii=False, indent=2)
+
+    print(f"{'threshold':>9}" + "".join(f"{column:>10}" for column in columns))
+    for threshold, row in zip(thresholds, table):
+        print(f"{threshold:>9g}" + "".join(f"{v:>10.2f}" for v in row))
+
+
 async def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -357,8 +1162,94 @@ async def main():
     parser.add_argument(
         "--event_threshold", type=float, default=0.3, help="Event matching threshold"
     )
+    parser.add_argument(
+        "--api_concurrency",
+        type=int,
+        default=16,
+        help="Maximum number of in-flight embedding/judge API calls across all files",
+    )
+    parser.add_argument(
+        "--judge_batch_size",
+        type=int,
+        default=1,
+        help="Number of text pairs packed into one LLM judge request (1 disables batching)",
+    )
+    parser.add_argument(
+        "--judge_high",
+        type=float,
+        default=None,
+        help="Cosine similarity at or above which pairs count as similar without a judge call",
+    )
+    parser.add_argument(
+        "--judge_low",
+        type=float,
+        default=None,
+        help="Cosine similarity below which pairs count as dissimilar without a judge call",
+    )
+    parser.add_argument(
+        "--calibration_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of short-circuited pairs still sent to the judge to measure agreement",
+    )
+    parser.add_argument(
+        "--index_type",
+        type=str,
+        default="flat",
+        choices=["flat", "ivf", "hnsw"],
+        help=f"Faiss index used for candidate pools of {INDEX_MIN_POOL}+ predictions",
+    )
+    parser.add_argument(
+        "--sweep",
+        type=str,
+        default=None,
+        help="Score a grid of event thresholds in one run instead of --event_threshold, "
+        "as 'start:stop:step' or a comma-separated list; writes sweep.csv and sweep.json",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-score every file, even when its inputs and config are unchanged",
+    )
+    parser.add_argument(
+        "--summary_every",
+        type=int,
+        default=50,
+        help="Rewrite summary.json after every N scored files (0 only writes it at the end)",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=1000,
+        help="Number of bootstrap resamples for the summary confidence intervals (0 disables)",
+    )
+    trace_group = parser.add_mutually_exclusive_group()
+    trace_group.add_argument(
+        "--record_trace",
+        type=str,
+        default=None,
+        help="Append every embedding and judge decision to this trace directory",
+    )
+    trace_group.add_argument(
+        "--replay_trace",
+        type=str,
+        default=None,
+        help="Serve embeddings and judge decisions from this trace directory, without API calls (implies --force)",
+    )
     args = parser.parse_args()
 
+    global api_semaphore, judge_batcher, judge_bands, index_type, trace_store
+    index_type = args.index_type
+    if args.record_trace:
+        trace_store = TraceStore(args.record_trace, "record")
+    elif args.replay_trace:
+        trace_store = TraceStore(args.replay_trace, "replay")
+    api_semaphore = asyncio.Semaphore(args.api_concurrency)
+    # asyncio.to_thread uses the default executor, which must not be the bottleneck
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=args.api_concurrency)
+    )
+
     os.makedirs(args.output_dir, exist_ok=True)
     embed_config = load_yaml_config(
         args.config_path, args.embedding_model, config_type="embed_config"
@@ -367,7 +1258,17 @@ async def main():
         args.config_path, args.llm_model, config_type="llm_config"
     )
 
-    file_pairs = []
+    if args.judge_batch_size > 1:
+        judge_batcher = BatchJudge(judge_config, batch_size=args.judge_batch_size)
+
+    if args.judge_high is not None or args.judge_low is not None:
+        judge_bands = JudgeBands(
+            args.judge_low, args.judge_high, sample_rate=args.calibration_rate
+        )
+
+    config = scoring_config(args, embed_config, judge_config)
+
+    all_pairs = []
     for f in os.listdir(args.input_dir):
         m = re.match(r"emotions_(\d+)(?:_(events))?\.json", f)
         if m:
@@ -375,101 +1276,109 @@ async def main():
             pred_file_path = os.path.join(args.input_dir, f)
             gt_file_path = os.path.join(args.gt_dir, f"chat_{idx}.json")
             out_file_path = os.path.join(args.output_dir, f"evaluation_{idx}.json")
-            if not os.path.exists(gt_file_path) or os.path.exists(out_file_path):
+            if not os.path.exists(gt_file_path):
                 print(f"[WARN] Skipping {f}")
                 continue
-            file_pairs.append((gt_file_path, pred_file_path, out_file_path))
-
-    file_pairs.sort(key=lambda x: int(re.search(r"emotions_(\d+)", x[1]).group(1)))
+            all_pairs.append((idx, gt_file_path, pred_file_path, out_file_path))
+    all_pairs.sort(key=lambda x: int(x[0]))
     sem = asyncio.Semaphore(args.batch)
-    all_state_percentages = []
-    all_source_id_percentages = []
-    all_reason_llm_percentages = []
-    all_reason_embed_percentages = []
-
-    async def sem_wrapper(g_fp, p_fp, o_fp, pbar):
-        async with sem:
-            result = await evaluate_chain(
-                load_json(g_fp),
-                load_json(p_fp),
-                embed_config,
-                judge_config,
-                event_threshold=args.event_threshold,
-            )
-            with open(o_fp, "w", encoding="utf-8") as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
 
-            total_score = result["total_score"]
-            all_state_percentages.append(total_score["total_state_score_percentage"])
-            all_source_id_percentages.append(
-                total_score["total_source_id_score_percentage"]
+    if args.sweep:
+        thresholds = parse_thresholds(args.sweep)
+
+        async def sweep_wrapper(idx, g_fp, p_fp, o_fp, pbar):
+            async with sem:
+                # Every best match is kept; thresholds are applied in sweep_scores
+                result = await evaluate_chain(
+                    load_json(g_fp),
+                    load_json(p_fp),
+                    embed_config,
+                    judge_config,
+                    event_threshold=-np.inf,
+                )
+                pbar.update(1)
+                return event_score_arrays(result)
+
+        with tqdm(total=len(all_pairs), desc="Sweeping") as pbar:
+            file_arrays = await asyncio.gather(
+                *(sweep_wrapper(*pair, pbar) for pair in all_pairs)
             )
-            all_reason_llm_percentages.append(
-                total_score["total_reason_llm_score_percentage"]
-            )
-            all_reason_embed_percentages.append(
-                total_score["total_reason_embed_score_percentage"]
-            )
-
-            pbar.update(1)
-            return result
-
-    with tqdm(total=len(file_pairs), desc="Evaluating") as pbar:
-        tasks = [
-            asyncio.create_task(sem_wrapper(g, p, o, pbar)) for g, p, o in file_pairs
-        ]
-        await asyncio.gather(*tasks)
-
-    average_state_percentage = (
-        round(sum(all_state_percentages) / len(all_state_percentages), 2)
-        if all_state_percentages
-        else 0.0
-    )
-    average_source_id_percentage = (
-        round(sum(all_source_id_percentages) / len(all_source_id_percentages), 2)
-        if all_source_id_percentages
-        else 0.0
-    )
-    average_reason_llm_percentage = (
-        round(sum(all_reason_llm_percentages) / len(all_reason_llm_percentages), 2)
-        if all_reason_llm_percentages
-        else 0.0
-    )
-    average_reason_embed_percentage = (
-        round(sum(all_reason_embed_percentages) / len(all_reason_embed_percentages), 2)
-        if all_reason_embed_percentages
-        else 0.0
-    )
-
-    summary = {
-        "average_score": {
-            "total_state_score_percentage": average_state_percentage,
-            "total_source_id_score_percentage": average_source_id_percentage,
-            "total_reason_llm_score_percentage": average_reason_llm_percentage,
-            "total_reason_embed_score_percentage": average_reason_embed_percentage,
-        },
-        "details": [],
-    }
-
-    for idx in range(len(all_state_percentages)):
-        summary["details"].append(
-            {
-                "data_set": f"data_{idx + 1}",
-                "total_state_score_percentage": all_state_percentages[idx],
-                "total_source_id_score_percentage": all_source_id_percentages[idx],
-                "total_reason_llm_score_percentage": all_reason_llm_percentages[idx],
-                "total_reason_embed_score_percentage": all_reason_embed_percentages[
-                    idx
-                ],
-            }
+        write_sweep(args.output_dir, thresholds, sweep_scores(file_arrays, thresholds))
+        print("[INFO] Threshold sweep has been saved to sweep.csv and sweep.json.")
+    else:
+        summary_path = os.path.join(args.output_dir, "summary.json")
+        aggregator = SummaryAggregator(num_bootstrap=args.bootstrap)
+        file_pairs = []
+        for pair in all_pairs:
+            idx, gt_file_path, pred_file_path, out_file_path = pair
+            # A replay is always recomputed, it exists to rescore from the trace
+            if not (args.force or args.replay_trace) and is_up_to_date(
+                args.output_dir, idx, gt_file_path, pred_file_path, config
+            ):
+                # Results of earlier runs count towards the summary as they are
+                aggregator.add(idx, load_json(out_file_path))
+            else:
+                file_pairs.append(pair)
+        print(
+            f"[INFO] {len(all_pairs) - len(file_pairs)} evaluations are up to date, "
+            f"{len(file_pairs)} to score"
         )
 
-    with open(
-        os.path.join(args.output_dir, "summary.json"), "w", encoding="utf-8"
-    ) as f:
-        json.dump(summary, f, ensure_ascii=False, indent=2)
-
-    print("[INFO] Summary has been saved to summary.json.")
+        async def sem_wrapper(idx, g_fp, p_fp, o_fp, pbar):
+            async with sem:
+                result = await evaluate_chain(
+                    load_json(g_fp),
+                    load_json(p_fp),
+                    embed_config,
+                    judge_config,
+                    event_threshold=args.event_threshold,
+                )
+                atomic_write(o_fp, json.dumps(result, ensure_ascii=False, indent=2))
+                record_manifest(args.output_dir, idx, g_fp, p_fp, config)
+
+                aggregator.add(idx, result)
+                pbar.update(1)
+                if args.summary_every > 0 and pbar.n % args.summary_every == 0:
+                    summary = aggregator.write(
+                        summary_path, partial=pbar.n < pbar.total
+                    )
+                    macro = summary["average_score"]
+                    pbar.set_postfix(
+                        {name: macro[key] for key, _, name in METRICS}, refresh=False
+                    )
+                return result
+
+        with tqdm(total=len(file_pairs), desc="Evaluating") as pbar:
+            tasks = [
+                asyncio.create_task(sem_wrapper(*pair, pbar)) for pair in file_pairs
+            ]
+            await asyncio.gather(*tasks)
+
+        aggregator.write(summary_path)
+        print("[INFO] Summary has been saved to summary.json.")
+
+    if judge_bands is not None:
+        calibration = judge_bands.report()
+        with open(
+            os.path.join(args.output_dir, "calibration.json"), "w", encoding="utf-8"
+        ) as f:
+            json.dump(calibration, f, ensure_ascii=False, indent=2)
+        print(
+            f"[INFO] Judge short-circuit skipped {calibration['skipped_ratio'] * 100:.1f}% "
+            "of judge calls, see calibration.json."
+        )
+    if judge_batcher is not None:
+        print(
+            f"[INFO] Batched judge: {judge_batcher.num_requests} requests, "
+            f"{judge_batcher.num_fallbacks} pairs fell back to single calls."
+        )
+    if trace_store is not None:
+        trace_store.close()
+        print(
+            f"[INFO] Trace {args.record_trace or args.replay_trace} holds "
+            f"{len(trace_store.embeddings)} embeddings and "
+            f"{len(trace_store.judgements)} judge decisions."
+        )
 
 
 if __name__ == "__main__":
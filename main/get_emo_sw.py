@@ -16,6 +16,81 @@ from utils import (
     parse_json_response,
 )
 
+# Per-speaker sections of a merged audio/video JSON, e.g. "1", "2_voice", "说话人3"
+SPEAKER_KEY_PATTERN = re.compile(r"^(?:说话人|发言人)?(\d+)(?:_voice)?$")
+# Bulky free-text fields that only repeat what the structured sections say
+SKIPPED_CONTEXT_KEYS = {"raw_text", "raw_response"}
+
+
+def chat_number(name):
+    match = re.search(r"(\d+)", name)
+    return match.group(1) if match else None
+
+
+class ChatContextStore:
+    """
+    Look up the merged audio/video JSON of each chat, from a directory of
+    `*_merged.json` files or from the consolidated JSONL written by combined.py.
+    Each chat is looked up once, so contexts are parsed on demand and not
+    cached: only the chats still in flight keep theirs alive.
+    """
+
+    def __init__(self, context_dir=None, context_index=None):
+        self.context_dir_files = {}
+        self.index_path = context_index
+        self.offsets = {}
+
+        if context_dir:
+            for fname in os.listdir(context_dir):
+                number = chat_number(fname)
+                if fname.endswith(".json") and number is not None:
+                    self.context_dir_files[number] = os.path.join(context_dir, fname)
+
+        if context_index:
+            with open(context_index + ".index.json", "r", encoding="utf-8") as f:
+                for chat_id, offset in json.load(f).items():
+                    number = chat_number(chat_id)
+                    if number is not None:
+                        self.offsets[number] = offset
+
+    def get(self, number):
+        """Merged context of chat `number`, or None if there is none"""
+        if number in self.offsets:
+            with open(self.index_path, "rb") as f:
+                f.seek(self.offsets[number])
+                return json.loads(f.readline().decode("utf-8"))["data"]
+        if number in self.context_dir_files:
+            with open(self.context_dir_files[number], "r", encoding="utf-8") as f:
+                return json.load(f)
+        return None
+
+
+def render_context_for_speakers(context, holders):
+    """
+    Render only the parts of a merged context relevant to the speakers of one
+    window: global sections are kept, per-speaker sections are filtered.
+    Holders without a speaker number (e.g. "主持人") cannot be matched to a
+    section, so if any holder is unresolved every speaker section is kept.
+    """
+    speakers = {chat_number(str(h)) for h in holders}
+    if None in speakers or not speakers:
+        speakers = None
+
+    def keep_speaker(key):
+        match = SPEAKER_KEY_PATTERN.match(str(key))
+        return match is None or speakers is None or match.group(1) in speakers
+
+    rendered = {}
+    for key, value in context.items():
+        if key in SKIPPED_CONTEXT_KEYS or not keep_speaker(key):
+            continue
+        if isinstance(value, list) and all(
+            isinstance(v, dict) and "id" in v for v in value
+        ):
+            value = [v for v in value if keep_speaker(v["id"])]
+        rendered[key] = value
+    return json.dumps(rendered, ensure_ascii=False, indent=2)
+
 
 def format_chat_history_for_llm(chat_data):
     formatted_chat = []
@@ -55,6 +130,7 @@ def segment_events_by_topic_with_sliding_window(
     step_size=8,
     speaker_timestamps=None,
     other_text=None,
+    context=None,
 ):
     total_sentences = len(dialogues)
     print(
@@ -74,6 +150,13 @@ def segment_events_by_topic_with_sliding_window(
 
         history_formatted = json.dumps(event_pool_copy, ensure_ascii=False, indent=2)
 
+        if context is not None:
+            window_other_text = render_context_for_speakers(
+                context, {item.get("holder", "") for item in window_data}
+            )
+        else:
+            window_other_text = other_text
+
         # 格式化说话人和时间戳信息
         speaker_timestamps_json = (
             json.dumps(speaker_timestamps, ensure_ascii=False, indent=2)
@@ -257,7 +340,7 @@ def segment_events_by_topic_with_sliding_window(
 [说话人时间戳摘要]
 {speaker_timestamps_json}
 [其他文本输入]
-{other_text}
+{window_other_text}
 - **请按照格式输出 JSON**，不要遗漏任何关键字段，source_id 一定要在emotions中输出，这个字段不能省略。
         """
         parsed_response = None
@@ -323,7 +406,22 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_dir", type=str, required=True)
     parser.add_argument(
-        "--other_text", type=str, required=True, help="timestamps and speaker info"
+        "--other_text",
+        type=str,
+        default="",
+        help="timestamps and speaker info, used for chats without their own context",
+    )
+    parser.add_argument(
+        "--context_dir",
+        type=str,
+        default=None,
+        help="Directory of merged audio/video JSON files from combined.py",
+    )
+    parser.add_argument(
+        "--context_index",
+        type=str,
+        default=None,
+        help="Consolidated JSONL file from combined.py --consolidated",
     )
     parser.add_argument("--output_dir", type=str, default="outputs")
     parser.add_argument("--config_path", type=str, default="config.yaml")
@@ -344,11 +442,12 @@ def main():
     args = parser.parse_args()
     window_sizes = list(map(int, args.window_sizes.split(",")))
     step_sizes = list(map(int, args.step_sizes.split(",")))
-    other_text = args.other_text
 
     if len(window_sizes) != len(step_sizes):
         raise ValueError("需要提供相同数量的滑动窗口和步长组合")
 
+    context_store = ChatContextStore(args.context_dir, args.context_index)
+
     llm_cfg = load_yaml_config(args.config_path, args.llm_model, "llm_config")
     os.makedirs(args.output_dir, exist_ok=True)
     all_files = sorted(
@@ -368,11 +467,9 @@ def main():
 
             for fname in all_files:
                 file_path = os.path.join(args.input_dir, fname)
-                # 尝试读取对应的txt文件
-                txt_file_path = os.path.join(
-                    args.input_dir, fname.replace(".json", ".txt")
-                )
-                other_text = args.other_text
+                context = context_store.get(chat_number(fname))
+                if context is None and (args.context_dir or args.context_index):
+                    print(f"[WARN] No merged context for {fname}, using --other_text")
                 with open(file_path, "r", encoding="utf-8") as f:
                     dialogues = json.load(f)
 
@@ -386,10 +483,8 @@ def main():
                         args.output_dir, f"output_emotions_{number}_events.json"
                     )
                     step_output_path = os.path.join(
-                        args.output_dir, f"other_text_{number}.json"
+                        args.output_dir, f"output_emotions_{number}_steps.json"
                     )
-                    event_output_path = os.path.join(args.output_dir)
-                    step_output_path = os.path.join(args.output_dir)
                     if os.path.exists(event_output_path) and os.path.exists(
                         step_output_path
                     ):
@@ -407,8 +502,9 @@ def main():
                             llm_cfg["base_url"],
                             llm_cfg["model"],
                             window_size,
-                            step_size,  # 传递说话人和时间戳信息
-                            other_text,
+                            step_size,
+                            other_text=args.other_text,
+                            context=context,
                         )
                     ] = (fname, window_size, step_size)
 
@@ -0,0 +1,27 @@
+import json
+
+from get_emo_sw import render_context_for_speakers
+
+CONTEXT = {
+    "scene": "会议室",
+    "1": {"emotion": "happy"},
+    "2_voice": {"emotion": "calm"},
+    "speakers": [{"id": "1", "note": "a"}, {"id": "说话人2", "note": "b"}],
+    "raw_text": "skipped",
+}
+
+
+def test_keeps_only_window_speakers():
+    rendered = json.loads(render_context_for_speakers(CONTEXT, ["发言人1"]))
+    assert rendered == {
+        "scene": "会议室",
+        "1": {"emotion": "happy"},
+        "speakers": [{"id": "1", "note": "a"}],
+    }
+
+
+def test_unresolved_holders_keep_all_speakers():
+    expected = {key: value for key, value in CONTEXT.items() if key != "raw_text"}
+    for holders in (["主持人"], ["主持人", "发言人1"], []):
+        rendered = json.loads(render_context_for_speakers(CONTEXT, holders))
+        assert rendered == expected, holders
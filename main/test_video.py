@@ -0,0 +1,92 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import video
+
+
+def make_folder(root_dir, name):
+    folder = os.path.join(root_dir, name)
+    os.makedirs(folder)
+    with open(os.path.join(folder, f"{name}.mp4"), "w") as f:
+        f.write(name)
+    with open(os.path.join(folder, f"{name}.txt"), "w", encoding="utf-8") as f:
+        f.write("发言人 1 00:01\n你好\n")
+
+
+def start_server(failing):
+    """Stub --serve process; clips whose video is in `failing` return an error"""
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, body):
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.reply({"model_path": "stub-model"})
+
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            clips = json.loads(self.rfile.read(length))["clips"]
+            names = [os.path.basename(clip["video_path"]) for clip in clips]
+            requested.extend(names)
+            self.reply(
+                {
+                    "outputs": ["[发言人1 00:00:01 happy]" for _ in names],
+                    "errors": ["boom" if name in failing else None for name in names],
+                }
+            )
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, requested
+
+
+def run_queue(monkeypatch, tmp_path, server):
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "video.py",
+            "--root_dir",
+            str(tmp_path / "root"),
+            "--output_dir",
+            str(tmp_path / "out"),
+            "--queue_dir",
+            str(tmp_path / "queue"),
+            "--server",
+            f"http://127.0.0.1:{server.server_address[1]}",
+            "--batch_size",
+            "2",
+        ],
+    )
+    video.main()
+
+
+def test_queue_rerun_picks_up_failed_folder(monkeypatch, tmp_path):
+    for i in range(1, 4):
+        make_folder(tmp_path / "root", f"chat-{i}")
+
+    failing = {"chat-2.mp4"}
+    server, requested = start_server(failing)
+    try:
+        run_queue(monkeypatch, tmp_path, server)
+        assert sorted(requested) == ["chat-1.mp4", "chat-2.mp4", "chat-3.mp4"]
+        assert os.listdir(tmp_path / "queue") == []
+
+        failing.clear()
+        requested.clear()
+        run_queue(monkeypatch, tmp_path, server)
+        assert requested == ["chat-2.mp4"]
+        assert os.path.exists(tmp_path / "out" / "chat-2_output.json")
+    finally:
+        server.shutdown()
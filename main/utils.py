@@ -1,9 +1,12 @@
+import hashlib
 import json
+import os
 import re
+import tempfile
+import threading
+from functools import lru_cache
 
-import faiss
 import numpy as np
-import torch
 import yaml
 from openai import AzureOpenAI, OpenAI
 
@@ -27,11 +30,16 @@ def load_yaml_config(config_path, api_name, config_type="llm_config"):
     if not api_config:
         raise ValueError(f"not found '{api_name}' configuration")
 
-    return {
+    loaded = {
         "model": api_config["model"],
-        "base_url": api_config["base_url"],
-        "api_key": api_config["api_key"],
+        "base_url": api_config.get("base_url"),
+        "api_key": api_config.get("api_key"),
     }
+    # Optional keys of local embedding backends (see call_embedding)
+    for key in ("backend", "device", "batch_size", "num_threads"):
+        if key in api_config:
+            loaded[key] = api_config[key]
+    return loaded
 
 
 def load_json(file_path):
@@ -40,6 +48,62 @@ def load_json(file_path):
     return data
 
 
+def atomic_write(path, text):
+    """Write to a temp file next to `path`, then rename it over `path`"""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(path)}."
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path, size, mtime_ns):
+    # size and mtime_ns are part of the cache key, so edited files are rehashed
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """sha256 of a file's contents, hashed once per size and mtime"""
+    stat = os.stat(path)
+    return _file_digest(path, stat.st_size, stat.st_mtime_ns)
+
+
+MANIFEST_DIR = "manifest"
+
+
+def manifest_path(output_dir, name):
+    # One entry per output, so concurrent writers never rewrite each other's records
+    return os.path.join(output_dir, MANIFEST_DIR, f"{name}.json")
+
+
+def write_manifest(output_dir, name, entry):
+    """Atomically record how the output `name` was produced"""
+    os.makedirs(os.path.join(output_dir, MANIFEST_DIR), exist_ok=True)
+    atomic_write(
+        manifest_path(output_dir, name), json.dumps(entry, ensure_ascii=False, indent=2)
+    )
+
+
+def read_manifest(output_dir, name):
+    """The manifest entry of the output `name`, or None if it is missing or unreadable"""
+    try:
+        return load_json(manifest_path(output_dir, name))
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
 def cosine_similarity(a, b):
     a = np.array(a, dtype=np.float32)
     b = np.array(b, dtype=np.float32)
@@ -161,10 +225,90 @@ def remove_spaces(obj):
         return obj
 
 
-def call_embedding(texts, api_key, base_url, model="embedding-3"):
+@lru_cache(maxsize=None)
+def load_local_embedder(model, device="cpu", num_threads=None):
+    """
+    Load a local embedding model once per process.
+
+    Uses sentence-transformers when it is installed and the model is a
+    sentence-transformer, otherwise a plain transformers encoder (e.g. the BERT
+    required by HumanOmni) with mean pooling.
+    """
+    import torch
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    try:
+        from sentence_transformers import SentenceTransformer
+
+        return "sentence_transformers", SentenceTransformer(model, device=device)
+    except (ImportError, OSError, ValueError):
+        pass
+
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model)
+    encoder = AutoModel.from_pretrained(model).to(device).eval()
+    return "transformers", (tokenizer, encoder)
+
+
+# Concurrent callers share one model; running them one at a time lets torch's
+# intra-op threads use every core instead of oversubscribing them. The lock
+# also covers the first load, so concurrent first calls load the model once.
+_local_embed_lock = threading.Lock()
+
+
+def call_local_embedding(texts, model, device="cpu", batch_size=64, num_threads=None):
+    with _local_embed_lock:
+        kind, embedder = load_local_embedder(model, device, num_threads)
+        if kind == "sentence_transformers":
+            vectors = embedder.encode(
+                texts, batch_size=batch_size, convert_to_numpy=True
+            )
+            return [np.asarray(v, dtype="float32") for v in vectors]
+
+        import torch
+
+        tokenizer, encoder = embedder
+        embeddings = []
+        with torch.no_grad():
+            for i in range(0, len(texts), batch_size):
+                inputs = tokenizer(
+                    texts[i : i + batch_size],
+                    padding=True,
+                    truncation=True,
+                    max_length=512,
+                    return_tensors="pt",
+                ).to(device)
+                hidden = encoder(**inputs).last_hidden_state
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                embeddings.extend(pooled.float().cpu().numpy())
+        return [np.asarray(v, dtype="float32") for v in embeddings]
+
+
+def call_embedding(
+    texts,
+    api_key=None,
+    base_url=None,
+    model="embedding-3",
+    backend="openai",
+    device="cpu",
+    batch_size=64,
+    num_threads=None,
+):
+    """
+    Embed texts with the backend named in embed_config: "openai" for any
+    OpenAI-compatible embeddings API, "local" for a model run in-process.
+    """
     if isinstance(texts, list):
         texts = [" " if text == "" else text for text in texts]
 
+    if backend == "local":
+        if isinstance(texts, str):
+            texts = [texts]
+        return call_local_embedding(texts, model, device, batch_size, num_threads)
+
     client = OpenAI(api_key=api_key, base_url=base_url)
     response = client.embeddings.create(model=model, input=texts)
     embeddings = []
@@ -186,12 +330,135 @@ def call_embeddings_batch(texts, api_key, base_url, model="embedding-3", batch_s
     return embeddings
 
 
-def build_faiss_index(dimension):
-    res = faiss.StandardGpuResources()
-    index = faiss.IndexFlatIP(dimension)
-    gpu_index = faiss.index_cpu_to_gpu(res, 0, index)
-    torch.cuda.empty_cache()
-    return gpu_index
+# torch and faiss are imported where they are used, so scripts that only need
+# the file and manifest helpers (e.g. the video.py --server client) stay light.
+
+
+def faiss_gpu_available():
+    import faiss
+
+    return hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0
+
+
+def build_faiss_index(dimension, index_type="flat", nlist=100, hnsw_m=32, use_gpu=None):
+    """
+    Build an inner-product faiss index.
+    :param index_type: 'flat' (exact), 'ivf' (inverted lists, needs training) or 'hnsw' (graph)
+    :param use_gpu: move the index to GPU 0; None means use it when one is available.
+        HNSW indexes always stay on CPU because faiss has no GPU implementation.
+    """
+    import faiss
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif index_type == "ivf":
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFFlat(
+            quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT
+        )
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'")
+
+    if use_gpu is None:
+        use_gpu = faiss_gpu_available()
+    if use_gpu and index_type != "hnsw":
+        import torch
+
+        res = faiss.StandardGpuResources()
+        index = faiss.index_cpu_to_gpu(res, 0, index)
+        torch.cuda.empty_cache()
+    return index
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over embeddings, backed by faiss.
+    Vectors are L2-normalized so inner product equals cosine similarity.
+    """
+
+    def __init__(
+        self,
+        dimension,
+        index_type="flat",
+        nlist=100,
+        hnsw_m=32,
+        nprobe=8,
+        use_gpu=None,
+    ):
+        self.dimension = dimension
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.nprobe = nprobe
+        self.use_gpu = faiss_gpu_available() if use_gpu is None else use_gpu
+        self.index = self._build(nlist)
+
+    def _build(self, nlist):
+        index = build_faiss_index(
+            self.dimension, self.index_type, nlist, self.hnsw_m, self.use_gpu
+        )
+        if self.index_type == "ivf":
+            index.nprobe = min(self.nprobe, nlist)
+        return index
+
+    @staticmethod
+    def _normalize(vectors):
+        import faiss
+
+        vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype="float32").copy()
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def add(self, vectors):
+        vectors = self._normalize(vectors)
+        if not self.index.is_trained:
+            # IVF needs at least as many training vectors as lists
+            if len(vectors) < self.index.nlist:
+                self.index = self._build(max(1, len(vectors)))
+            self.index.train(vectors)
+        self.index.add(vectors)
+
+    def search(self, queries, k=1):
+        """Return (similarities, ids) arrays of shape (len(queries), k); ids are -1 when empty"""
+        queries = self._normalize(queries)
+        k = max(1, min(k, len(self)))
+        return self.index.search(queries, k)
+
+    def save(self, path):
+        import faiss
+
+        index = self.index
+        if self.use_gpu and self.index_type != "hnsw":
+            index = faiss.index_gpu_to_cpu(index)
+        faiss.write_index(index, path)
+
+    @classmethod
+    def load(cls, path, use_gpu=None, nprobe=8):
+        import faiss
+
+        index = faiss.read_index(path)
+        if isinstance(index, faiss.IndexHNSWFlat):
+            index_type = "hnsw"
+        elif isinstance(index, faiss.IndexIVF):
+            index_type = "ivf"
+        else:
+            index_type = "flat"
+        vector_index = cls.__new__(cls)
+        vector_index.dimension = index.d
+        vector_index.index_type = index_type
+        vector_index.hnsw_m = 32
+        vector_index.nprobe = nprobe
+        vector_index.use_gpu = faiss_gpu_available() if use_gpu is None else use_gpu
+        if vector_index.use_gpu and index_type != "hnsw":
+            index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
+        if index_type == "ivf":
+            index.nprobe = nprobe
+        vector_index.index = index
+        return vector_index
 
 
 def merge_similar_emotions_with_llm(emotions, api_key, base_url, model_name):
@@ -1,15 +1,28 @@
 import argparse
+import hashlib
 import json
 import os
 import re
+import socket
+import subprocess
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
-import torch
-from humanomni import mm_infer, model_init
-from humanomni.utils import disable_torch_init
-from transformers import BertTokenizer
+import requests
+
+from utils import atomic_write, file_digest, read_manifest, write_manifest
 
 os.environ["TRANSFORMERS_OFFLINE"] = "1"
-os.environ["CUDA_VISIBLE_DEVICES"] = "0"
+
+# Rough GPU memory needed per clip in a batch for R1-Omni-0.5B in fp16
+# (frames + whisper features + KV cache), used to size batches automatically.
+DEFAULT_CLIP_MEMORY_GB = 1.5
+MAX_BATCH_SIZE = 32
+# A --server client waits at most this long per clip of a request
+REMOTE_CLIP_TIMEOUT = 600
+
+# Bump whenever build_instruct changes, so the manifest invalidates old outputs.
+PROMPT_VERSION = "1"
 
 
 def extract_speaker_timestamps(file_path):
@@ -46,6 +59,8 @@ def process_video(
     modal="video_audio",
 ):
     """Process videos and perform model inference"""
+    from humanomni import mm_infer
+
     # Process video input
     video_tensor = processor["video"](video_path)
 
@@ -71,16 +86,200 @@ def process_video(
     return output
 
 
-def process_folder(
-    folder_path,
-    output_dir,
+def preprocess_clip(clip, processor, modal="video_audio"):
+    """
+    Load the video frames and audio features of one clip.
+
+    A clip is a dict with "video_path" and "instruct", plus optional "start" and
+    "end" (seconds) to cut a timestamp segment out of the video.
+    """
+    start, end = clip.get("start"), clip.get("end")
+    if start is None and end is None:
+        video_tensor = processor["video"](clip["video_path"])
+    else:
+        video_tensor = processor["video"](clip["video_path"], s=start, e=end)
+
+    if modal == "video_audio" or modal == "audio":
+        if start is None and end is None:
+            audio = processor["audio"](clip["video_path"])[0]
+        else:
+            audio = processor["audio"](clip["video_path"], s=start, e=end)[0]
+    else:
+        audio = None
+
+    return video_tensor, audio
+
+
+def mm_infer_batch(
+    video_tensors,
+    instructs,
+    model,
+    tokenizer,
+    bert_tokenizer,
+    modal="video_audio",
+    audios=None,
+    max_new_tokens=2048,
+):
+    """
+    Batched counterpart of `humanomni.mm_infer`.
+
+    Every clip gets its own chat prompt; the prompts are left-padded to a common
+    length and run through a single `model.generate` call, then decoded per sample.
+    """
+    import torch
+    from humanomni.constants import DEFAULT_AUDIO_TOKEN, DEFAULT_VIDEO_TOKEN
+    from humanomni.mm_utils import tokenizer_multimodal_token
+
+    device, dtype = model.device, model.dtype
+    if modal == "video_audio":
+        modal_token = DEFAULT_VIDEO_TOKEN + "\n" + DEFAULT_AUDIO_TOKEN
+    elif modal == "audio":
+        modal_token = DEFAULT_AUDIO_TOKEN
+    else:
+        modal_token = DEFAULT_VIDEO_TOKEN
+
+    if modal == "audio":
+        images = [
+            (torch.zeros(32, 3, 384, 384, device=device, dtype=dtype), "video")
+            for _ in instructs
+        ]
+    else:
+        images = [(tensor.to(device, dtype), "video") for tensor in video_tensors]
+
+    audio_batch = None
+    if audios is not None and all(a is not None for a in audios):
+        audio_batch = torch.cat(
+            [a if a.dim() == 3 else a.unsqueeze(0) for a in audios], dim=0
+        )
+        audio_batch = audio_batch.to(device, dtype)
+
+    sequences = []
+    for instruct in instructs:
+        message = [{"role": "user", "content": modal_token + "\n" + instruct}]
+        prompt = tokenizer.apply_chat_template(
+            message, tokenize=False, add_generation_prompt=True
+        )
+        sequences.append(
+            tokenizer_multimodal_token(
+                prompt, tokenizer, modal_token, return_tensors="pt"
+            ).long()
+        )
+
+    # Left padding keeps the generated tokens aligned at the end of every row.
+    pad_id = tokenizer.pad_token_id
+    if pad_id is None:
+        pad_id = tokenizer.eos_token_id
+    max_len = max(seq.shape[0] for seq in sequences)
+    input_ids = torch.full((len(sequences), max_len), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), max_len), dtype=torch.long)
+    for i, seq in enumerate(sequences):
+        input_ids[i, max_len - seq.shape[0] :] = seq
+        attention_mask[i, max_len - seq.shape[0] :] = 1
+    model.config.tokenizer_padding_side = "left"
+
+    question_prompt = bert_tokenizer(
+        list(instructs),
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+        add_special_tokens=True,
+    )
+    question_prompt = {k: v.to(device) for k, v in question_prompt.items()}
+
+    with torch.inference_mode():
+        output_ids = model.generate(
+            input_ids.to(device),
+            attention_mask=attention_mask.to(device),
+            images=images,
+            do_sample=False,
+            max_new_tokens=max_new_tokens,
+            use_cache=True,
+            pad_token_id=tokenizer.eos_token_id,
+            prompts=question_prompt,
+            audios=audio_batch,
+        )
+
+    outputs = tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+    return [output.strip() for output in outputs]
+
+
+def auto_batch_size(clip_memory_gb=DEFAULT_CLIP_MEMORY_GB, max_batch=MAX_BATCH_SIZE):
+    """Pick a batch size from the free GPU memory, 1 on CPU."""
+    import torch
+
+    if not torch.cuda.is_available():
+        return 1
+    free_bytes, _ = torch.cuda.mem_get_info()
+    return max(1, min(max_batch, int(free_bytes / (clip_memory_gb * 1024**3))))
+
+
+def process_videos_batched(
+    clips,
     model,
     processor,
     tokenizer,
     bert_tokenizer,
     modal="video_audio",
+    batch_size=None,
 ):
-    """Handle a single folder"""
+    """
+    Run inference on a list of clips in batches and return one output per clip.
+    Clips that could not be processed get the raised exception as their output.
+
+    When batch_size is None it is derived from the free GPU memory. A batch that
+    runs out of memory is split in half and retried, and the smaller size is kept
+    for the remaining batches.
+    """
+    import torch
+
+    if batch_size is None:
+        batch_size = auto_batch_size()
+    print(f"Running batched inference on {len(clips)} clips (batch size {batch_size})")
+
+    def run(batch):
+        tensors, audios = zip(
+            *(preprocess_clip(clip, processor, modal) for clip in batch)
+        )
+        return mm_infer_batch(
+            tensors,
+            [clip["instruct"] for clip in batch],
+            model=model,
+            tokenizer=tokenizer,
+            bert_tokenizer=bert_tokenizer,
+            modal=modal,
+            audios=audios,
+        )
+
+    outputs = []
+    i = 0
+    while i < len(clips):
+        batch = clips[i : i + batch_size]
+        try:
+            outputs.extend(run(batch))
+        except torch.cuda.OutOfMemoryError as e:
+            torch.cuda.empty_cache()
+            if batch_size == 1:
+                outputs.append(e)
+                i += 1
+                continue
+            batch_size = max(1, batch_size // 2)
+            print(f"Out of memory, retrying with batch size {batch_size}")
+            continue
+        except Exception as e:
+            # Retry the clips one by one so a single bad video does not sink the batch
+            print(f"Batch starting at clip {i} failed ({str(e)}), retrying one by one")
+            for clip in batch:
+                try:
+                    outputs.extend(run([clip]))
+                except Exception as clip_error:
+                    outputs.append(clip_error)
+        i += len(batch)
+
+    return outputs
+
+
+def prepare_folder(folder_path):
+    """Build the inference clip of a chat folder, or None if its inputs are missing"""
     folder_name = os.path.basename(folder_path)
 
     video_path = os.path.join(folder_path, f"{folder_name}.mp4")
@@ -88,58 +287,442 @@ def process_folder(
 
     if not os.path.exists(video_path):
         print(f"Warning: Video file not found at {video_path}")
-        return
+        return None
     if not os.path.exists(transcript_file):
         print(f"Warning: Transcript file not found at {transcript_file}")
-        return
+        return None
 
     speaker_timestamps = extract_speaker_timestamps(transcript_file)
     if not speaker_timestamps:
         print(f"Warning: No speaker/timestamp data found in {transcript_file}")
+        return None
+
+    return {
+        "folder_name": folder_name,
+        "video_path": video_path,
+        "instruct": build_instruct(speaker_timestamps),
+        "input_hash": folder_input_hash(folder_path),
+    }
+
+
+def folder_input_hash(folder_path):
+    """Content hash of the video and transcript of a chat folder"""
+    folder_name = os.path.basename(folder_path)
+    digest = hashlib.sha256()
+    for ext in ("mp4", "txt"):
+        path = os.path.join(folder_path, f"{folder_name}.{ext}")
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def record_manifest(output_dir, clip, status, model_path=None, modal="video_audio"):
+    """Record how the outputs of a folder were produced"""
+    entry = {
+        "folder_name": clip["folder_name"],
+        "status": status,
+        "input_hash": clip["input_hash"],
+        "model_path": model_path,
+        "modal": modal,
+        "prompt_version": PROMPT_VERSION,
+    }
+    write_manifest(output_dir, clip["folder_name"], entry)
+
+
+def is_up_to_date(folder_path, output_dir, model_path=None, modal="video_audio"):
+    """
+    True if the folder was processed successfully with the same inputs, model,
+    modal and prompt version, and its outputs are still on disk.
+    """
+    folder_name = os.path.basename(folder_path)
+    outputs = [
+        os.path.join(output_dir, f"{folder_name}_raw_output.txt"),
+        os.path.join(output_dir, f"{folder_name}_output.json"),
+    ]
+    entry = read_manifest(output_dir, folder_name)
+    if entry is None or not all(map(os.path.exists, outputs)):
+        return False
+    try:
+        input_hash = folder_input_hash(folder_path)
+    except OSError:
+        return False
+    return (
+        entry.get("status") == "done"
+        and entry.get("input_hash") == input_hash
+        and entry.get("model_path") == model_path
+        and entry.get("modal") == modal
+        and entry.get("prompt_version") == PROMPT_VERSION
+    )
+
+
+def save_folder_output(folder_name, output, output_dir):
+    """Save the raw model output of a folder and the parsed emotion list"""
+    # Save the original output
+    raw_output_file = os.path.join(output_dir, f"{folder_name}_raw_output.txt")
+    atomic_write(raw_output_file, output)
+
+    # Output of the analytical model
+    pattern = re.compile(r"\[([^\]]+)\s+(\d{2}:\d{2}:\d{2})\s+([^\]]+)\]")
+    matches = pattern.findall(output)
+    results = []
+
+    for match in matches:
+        speaker, timestamp, emotion = match
+        results.append(
+            {"speaker": speaker, "timestamp": timestamp, "emotion": emotion.strip()}
+        )
+
+    # Save the result after parsing
+    output_file = os.path.join(output_dir, f"{folder_name}_output.json")
+    atomic_write(output_file, json.dumps(results, ensure_ascii=False, indent=4))
+
+    # A stale error file from an earlier failed run no longer applies
+    error_file = os.path.join(output_dir, f"{folder_name}_error.txt")
+    if os.path.exists(error_file):
+        os.remove(error_file)
+
+    print(f"Processed {folder_name}: {len(results)} emotions detected")
+    print(f"Raw output saved to {raw_output_file}")
+    print(f"Structured results saved to {output_file}")
+
+
+def save_folder_error(folder_name, error, output_dir):
+    error_file = os.path.join(output_dir, f"{folder_name}_error.txt")
+    atomic_write(error_file, str(error))
+
+
+def process_folder(
+    folder_path,
+    output_dir,
+    model,
+    processor,
+    tokenizer,
+    bert_tokenizer,
+    modal="video_audio",
+    model_path=None,
+):
+    """Handle a single folder"""
+    clip = prepare_folder(folder_path)
+    if clip is None:
         return
-    instruct = build_instruct(speaker_timestamps)
     # Process videos and perform reasoning
     try:
         output = process_video(
-            video_path=video_path,
-            instruct=instruct,
+            video_path=clip["video_path"],
+            instruct=clip["instruct"],
             model=model,
             processor=processor,
             tokenizer=tokenizer,
             bert_tokenizer=bert_tokenizer,
             modal=modal,
         )
+        save_folder_output(clip["folder_name"], output, output_dir)
+        record_manifest(output_dir, clip, "done", model_path, modal)
+
+    except Exception as e:
+        print(f"Error processing folder {folder_path}: {str(e)}")
+        save_folder_error(clip["folder_name"], e, output_dir)
+        record_manifest(output_dir, clip, "failed", model_path, modal)
+
+
+def process_folders_batched(
+    folder_paths,
+    output_dir,
+    model,
+    processor,
+    tokenizer,
+    bert_tokenizer,
+    modal="video_audio",
+    batch_size=None,
+    model_path=None,
+):
+    """Handle several folders with batched inference"""
+    clips = [clip for clip in map(prepare_folder, folder_paths) if clip is not None]
+    if not clips:
+        return
+
+    outputs = process_videos_batched(
+        clips,
+        model=model,
+        processor=processor,
+        tokenizer=tokenizer,
+        bert_tokenizer=bert_tokenizer,
+        modal=modal,
+        batch_size=batch_size,
+    )
+
+    save_clip_outputs(clips, outputs, output_dir, model_path, modal)
+
+
+def save_clip_outputs(clips, outputs, output_dir, model_path=None, modal="video_audio"):
+    """Save the output (or the error) of every clip and record it in the manifest"""
+    for clip, output in zip(clips, outputs):
+        if isinstance(output, Exception):
+            print(f"Error processing folder {clip['folder_name']}: {str(output)}")
+            save_folder_error(clip["folder_name"], output, output_dir)
+            record_manifest(output_dir, clip, "failed", model_path, modal)
+        else:
+            save_folder_output(clip["folder_name"], output, output_dir)
+            record_manifest(output_dir, clip, "done", model_path, modal)
+
+
+def load_model(model_path, bert_model, device="cuda"):
+    """Load the BERT tokenizer and R1-Omni, the slow part of every run"""
+    # Imported here so a --server client never loads torch or HumanOmni
+    import torch
+    from humanomni import model_init
+    from humanomni.utils import disable_torch_init
+    from transformers import BertTokenizer
+
+    # Initialize the BERT tokenizer
+    bert_tokenizer = BertTokenizer.from_pretrained(bert_model)
+
+    disable_torch_init()
+
+    if device == "cpu":
+        torch.set_num_threads(int(os.environ.get("OMP_NUM_THREADS", os.cpu_count())))
+        model, processor, tokenizer = model_init(
+            model_path, device="cpu", device_map={"": "cpu"}
+        )
+        model = model.float()
+    else:
+        model, processor, tokenizer = model_init(model_path)
+    return model, processor, tokenizer, bert_tokenizer
+
+
+def serve(
+    host,
+    port,
+    model,
+    processor,
+    tokenizer,
+    bert_tokenizer,
+    model_path=None,
+    batch_size=None,
+):
+    """
+    Keep the model loaded and serve inference over localhost HTTP.
+
+    GET /health returns the model path; POST /infer takes
+    {"clips": [{"video_path", "instruct", "start", "end"}], "modal"} and returns
+    {"outputs": [...], "errors": [...]} with one entry per clip. Requests are
+    handled one at a time, so clients never compete for GPU memory.
+    """
+
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != "/health":
+                self._reply(404, {"error": f"unknown path {self.path}"})
+                return
+            self._reply(200, {"status": "ok", "model_path": model_path})
+
+        def do_POST(self):
+            if self.path != "/infer":
+                self._reply(404, {"error": f"unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length).decode("utf-8"))
+                outputs = process_videos_batched(
+                    request["clips"],
+                    model=model,
+                    processor=processor,
+                    tokenizer=tokenizer,
+                    bert_tokenizer=bert_tokenizer,
+                    modal=request.get("modal", "video_audio"),
+                    batch_size=request.get("batch_size") or batch_size,
+                )
+            except Exception as e:
+                self._reply(400, {"error": str(e)})
+                return
+            self._reply(
+                200,
+                {
+                    "outputs": [
+                        None if isinstance(o, Exception) else o for o in outputs
+                    ],
+                    "errors": [
+                        str(o) if isinstance(o, Exception) else None for o in outputs
+                    ],
+                },
+            )
+
+    server = HTTPServer((host, port), InferenceHandler)
+    print(f"Serving {model_path} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
 
-        # Save the original output
-        raw_output_file = os.path.join(output_dir, f"{folder_name}_raw_output.txt")
-        with open(raw_output_file, "w", encoding="utf-8") as f:
-            f.write(output)
+def server_info(server_url):
+    response = requests.get(f"{server_url.rstrip('/')}/health", timeout=10)
+    response.raise_for_status()
+    return response.json()
 
-        # Output of the analytical model
-        pattern = re.compile(r"\[([^\]]+)\s+(\d{2}:\d{2}:\d{2})\s+([^\]]+)\]")
-        matches = pattern.findall(output)
-        results = []
 
-        for match in matches:
-            speaker, timestamp, emotion = match
-            results.append(
-                {"speaker": speaker, "timestamp": timestamp, "emotion": emotion.strip()}
+def process_folders_remote(
+    folder_paths,
+    output_dir,
+    server_url,
+    modal="video_audio",
+    batch_size=None,
+    model_path=None,
+):
+    """
+    Handle several folders by sending their clips to a running `--serve` process.
+
+    Clips go out in requests of `batch_size` (MAX_BATCH_SIZE when the server
+    sizes batches itself), and every response is saved before the next request,
+    so a dropped connection or server error only loses that one request.
+    """
+    clips = [clip for clip in map(prepare_folder, folder_paths) if clip is not None]
+    if not clips:
+        return
+
+    chunk_size = batch_size or MAX_BATCH_SIZE
+    for start in range(0, len(clips), chunk_size):
+        chunk = clips[start : start + chunk_size]
+        payload = {
+            "clips": [
+                {"video_path": clip["video_path"], "instruct": clip["instruct"]}
+                for clip in chunk
+            ],
+            "modal": modal,
+            "batch_size": batch_size,
+        }
+        try:
+            response = requests.post(
+                f"{server_url.rstrip('/')}/infer",
+                json=payload,
+                timeout=(10, REMOTE_CLIP_TIMEOUT * len(chunk)),
             )
+            response.raise_for_status()
+            result = response.json()
+            outputs = [
+                RuntimeError(error) if error is not None else output
+                for output, error in zip(result["outputs"], result["errors"])
+            ]
+        except Exception as e:
+            outputs = [e] * len(chunk)
 
-        # Save the result after parsing
-        output_file = os.path.join(output_dir, f"{folder_name}_output.json")
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
+        save_clip_outputs(chunk, outputs, output_dir, model_path, modal)
+        print(f"Remote inference: {start + len(chunk)}/{len(clips)} clips done")
 
-        print(f"Processed {folder_name}: {len(results)} emotions detected")
-        print(f"Raw output saved to {raw_output_file}")
-        print(f"Structured results saved to {output_file}")
 
-    except Exception as e:
-        print(f"Error processing folder {folder_path}: {str(e)}")
-        error_file = os.path.join(output_dir, f"{folder_name}_error.txt")
-        with open(error_file, "w", encoding="utf-8") as f:
-            f.write(str(e))
+def list_chat_folders(root_dir):
+    """Sorted chat-<number> folders, so every worker sees the same order"""
+    chat_folders = []
+    for item in os.listdir(root_dir):
+        item_path = os.path.join(root_dir, item)
+        if os.path.isdir(item_path) and re.match(r"chat-\d+", item):
+            chat_folders.append(item_path)
+    return sorted(chat_folders)
+
+
+def select_shard(folder_paths, shard_index, num_shards):
+    """Static round-robin split of the folder list, no coordination needed"""
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+    return folder_paths[shard_index::num_shards]
+
+
+def claim_folders(queue_dir, folder_paths, limit):
+    """
+    Claim up to `limit` unclaimed folders from a shared work-queue directory.
+
+    A folder is claimed by atomically creating `<folder>.lock` in queue_dir, so
+    workers on any node sharing the directory never process the same folder at
+    the same time. Workers release their locks once a batch is done (see
+    release_folders); only locks left by a crashed worker have to be deleted by
+    hand.
+    """
+    claimed = []
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    for folder_path in folder_paths:
+        if len(claimed) >= limit:
+            break
+        lock_path = queue_lock_path(queue_dir, folder_path)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(owner)
+        claimed.append(folder_path)
+    return claimed
+
+
+def queue_lock_path(queue_dir, folder_path):
+    return os.path.join(queue_dir, f"{os.path.basename(folder_path)}.lock")
+
+
+def release_folders(queue_dir, folder_paths):
+    """Remove the locks of claimed folders, whether they succeeded or failed"""
+    for folder_path in folder_paths:
+        try:
+            os.remove(queue_lock_path(queue_dir, folder_path))
+        except FileNotFoundError:
+            pass
+
+
+def launch_workers(num_workers, device, shard_index=0, num_shards=1):
+    """
+    Re-run this script as `num_workers` shard processes and wait for them.
+
+    The node's own shard is split further, so `--shard_index/--num_shards` still
+    partition the work across nodes. On GPU each worker gets its own device; on
+    CPU the cores are split evenly between the workers.
+    """
+    # Drop both the `--flag value` and `--flag=value` forms. The values are
+    # re-appended below, and argparse keeps the last occurrence, so even an
+    # abbreviated flag left in argv is overridden.
+    flags = ("--num_workers", "--shard_index", "--num_shards", "--gpu")
+    argv = []
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg in flags:
+            next(args, None)
+        elif not arg.startswith(tuple(f"{flag}=" for flag in flags)):
+            argv.append(arg)
+
+    if os.environ.get("CUDA_VISIBLE_DEVICES"):
+        gpus = os.environ["CUDA_VISIBLE_DEVICES"].split(",")
+    elif device == "cuda":
+        import torch
+
+        gpus = [str(i) for i in range(max(1, torch.cuda.device_count()))]
+    else:
+        gpus = []
+    threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    procs = []
+    for i in range(num_workers):
+        env = os.environ.copy()
+        cmd = [sys.executable, os.path.abspath(__file__)] + argv
+        cmd += [
+            "--num_workers",
+            "1",
+            "--shard_index",
+            str(shard_index * num_workers + i),
+            "--num_shards",
+            str(num_shards * num_workers),
+        ]
+        if device == "cuda":
+            cmd += ["--gpu", gpus[i % len(gpus)]]
+        else:
+            env["OMP_NUM_THREADS"] = str(threads)
+        procs.append(subprocess.Popen(cmd, env=env))
+    return max(proc.wait() for proc in procs)
 
 
 def main():
@@ -149,11 +732,11 @@ def main():
     parser.add_argument(
         "--root_dir",
         type=str,
-        required=True,
+        default=None,
         help="Root directory containing chat-<number> folders",
     )
     parser.add_argument(
-        "--output_dir", type=str, required=True, help="Directory to save output files"
+        "--output_dir", type=str, default=None, help="Directory to save output files"
     )
     parser.add_argument(
         "--modal",
@@ -174,45 +757,220 @@ def main():
         default="/root/.cache/modelscope/hub/models/iic/R1-Omni-0.5B",
         help="Path to the model",
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1,
+        help="Clips per forward pass, 0 to size batches from free GPU memory",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda",
+        choices=["cuda", "cpu"],
+        help="Run the model on GPU or CPU only",
+    )
+    parser.add_argument(
+        "--gpu",
+        type=str,
+        default=None,
+        help="Value for CUDA_VISIBLE_DEVICES (default: keep the environment, else 0)",
+    )
+    parser.add_argument(
+        "--shard_index", type=int, default=0, help="Index of this worker's shard"
+    )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=1,
+        help="Total number of shards the folder list is split into",
+    )
+    parser.add_argument(
+        "--queue_dir",
+        type=str,
+        default=None,
+        help="Shared work-queue directory; workers claim folders with lock files "
+        "instead of using static shards",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Spawn this many local worker processes (one per GPU, or splitting CPU cores)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Reprocess every folder, even those the manifest marks as up to date",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Load the model once and serve inference requests over localhost HTTP",
+    )
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="Address for --serve"
+    )
+    parser.add_argument("--port", type=int, default=8765, help="Port for --serve")
+    parser.add_argument(
+        "--server",
+        type=str,
+        default=None,
+        help="URL of a running --serve process (e.g. http://127.0.0.1:8765); "
+        "inference is sent there instead of loading the model",
+    )
 
     args = parser.parse_args()
+    if not args.serve and not (args.root_dir and args.output_dir):
+        parser.error("--root_dir and --output_dir are required unless --serve is set")
 
-    # Create an output directory
-    os.makedirs(args.output_dir, exist_ok=True)
+    if args.num_workers > 1:
+        sys.exit(
+            launch_workers(
+                args.num_workers, args.device, args.shard_index, args.num_shards
+            )
+        )
 
-    # Initialize the BERT tokenizer
-    bert_tokenizer = BertTokenizer.from_pretrained(args.bert_model)
+    if args.device == "cpu":
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    elif args.gpu is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = args.gpu
+    else:
+        os.environ.setdefault("CUDA_VISIBLE_DEVICES", "0")
 
-    disable_torch_init()
+    batch_size = args.batch_size or None
+    if args.device == "cpu" and batch_size is None:
+        batch_size = 1
 
-    model, processor, tokenizer = model_init(args.model_path)
+    if args.serve:
+        model, processor, tokenizer, bert_tokenizer = load_model(
+            args.model_path, args.bert_model, args.device
+        )
+        serve(
+            args.host,
+            args.port,
+            model,
+            processor,
+            tokenizer,
+            bert_tokenizer,
+            model_path=args.model_path,
+            batch_size=batch_size,
+        )
+        return
 
-    chat_folders = []
-    for item in os.listdir(args.root_dir):
-        item_path = os.path.join(args.root_dir, item)
-        if os.path.isdir(item_path) and re.match(r"chat-\d+", item):
-            chat_folders.append(item_path)
+    model_path = args.model_path
+    if args.server:
+        model_path = server_info(args.server)["model_path"]
+
+    # Create an output directory
+    os.makedirs(args.output_dir, exist_ok=True)
 
+    chat_folders = list_chat_folders(args.root_dir)
     if not chat_folders:
         print("No chat-<number> folders found in the specified directory")
         return
+    if args.queue_dir:
+        os.makedirs(args.queue_dir, exist_ok=True)
+    else:
+        chat_folders = select_shard(chat_folders, args.shard_index, args.num_shards)
+
+    if not args.force:
+        pending = [
+            folder_path
+            for folder_path in chat_folders
+            if not is_up_to_date(folder_path, args.output_dir, model_path, args.modal)
+        ]
+        print(f"Skipping {len(chat_folders) - len(pending)} up-to-date folders")
+        chat_folders = pending
+        if not chat_folders:
+            print("Nothing to do, all outputs are up to date")
+            return
+
+    print(
+        f"Found {len(chat_folders)} chat folders to process "
+        f"(shard {args.shard_index}/{args.num_shards}, device {args.device})"
+    )
+
+    if args.server:
+        model = processor = tokenizer = bert_tokenizer = None
+    else:
+        model, processor, tokenizer, bert_tokenizer = load_model(
+            args.model_path, args.bert_model, args.device
+        )
 
-    print(f"Found {len(chat_folders)} chat folders to process")
+    # mm_infer moves inputs to CUDA itself, so CPU runs always use the batched path
+    batched = args.batch_size != 1 or args.device == "cpu"
 
-    for folder_path in chat_folders:
-        try:
-            process_folder(
-                folder_path=folder_path,
+    def run(folder_paths):
+        if args.server:
+            process_folders_remote(
+                folder_paths,
+                output_dir=args.output_dir,
+                server_url=args.server,
+                modal=args.modal,
+                batch_size=batch_size,
+                model_path=model_path,
+            )
+            return
+        if batched:
+            process_folders_batched(
+                folder_paths,
                 output_dir=args.output_dir,
                 model=model,
                 processor=processor,
                 tokenizer=tokenizer,
                 bert_tokenizer=bert_tokenizer,
                 modal=args.modal,
+                batch_size=batch_size,
+                model_path=args.model_path,
             )
-        except Exception as e:
-            print(f"Error processing folder {folder_path}: {str(e)}")
-            continue
+            return
+        for folder_path in folder_paths:
+            try:
+                process_folder(
+                    folder_path=folder_path,
+                    output_dir=args.output_dir,
+                    model=model,
+                    processor=processor,
+                    tokenizer=tokenizer,
+                    bert_tokenizer=bert_tokenizer,
+                    modal=args.modal,
+                    model_path=args.model_path,
+                )
+            except Exception as e:
+                print(f"Error processing folder {folder_path}: {str(e)}")
+                continue
+
+    if args.queue_dir:
+        # Claim a batch worth of folders at a time so idle workers keep pulling work
+        claim_size = batch_size or (
+            MAX_BATCH_SIZE if args.server else auto_batch_size()
+        )
+        # Each worker attempts a folder at most once per run. Locks are released
+        # after every batch, so a rerun picks up the folders that failed.
+        remaining = list(chat_folders)
+        while True:
+            claimed = claim_folders(args.queue_dir, remaining, claim_size)
+            if not claimed:
+                break
+            remaining = [path for path in remaining if path not in claimed]
+            try:
+                todo = claimed
+                if not args.force:
+                    # Another worker may have finished it since this run started
+                    todo = [
+                        path
+                        for path in claimed
+                        if not is_up_to_date(
+                            path, args.output_dir, model_path, args.modal
+                        )
+                    ]
+                if todo:
+                    run(todo)
+            finally:
+                release_folders(args.queue_dir, claimed)
+    else:
+        run(chat_folders)
 
     print(f"\nBatch processing completed. Results saved to {args.output_dir}")
 